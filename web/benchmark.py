@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""server.py 基准测试
+
+按不同数据量生成模拟的报名和联系记录，在临时目录中启动 server.py，
+用多线程 HTTP 客户端对各个接口施压，输出每个接口的吞吐量和 p50/p95/p99 延迟（JSON）。
+
+用法:
+    python benchmark.py                                  # 默认 1k、10k 两档
+    python benchmark.py --sizes 1000,10000,100000,1000000 --duration 20 --output result.json
+    python benchmark.py --storage sqlite --server-mode asyncio
+    python benchmark.py --compare baseline.json          # 与之前的结果比较，退化超过阈值时退出码为 1
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+# 模拟记录的 ID 与 server.py 的 IdGenerator 位布局相同：(毫秒 - ID_EPOCH_MS) << 12 | 工作进程号 << 7 | 序号；
+# 使用最后一个工作进程号，不会与压测期间服务器新生成的 ID 重复
+ID_EPOCH_MS = 1704067200000
+SYNTHETIC_WORKER_ID = 31
+
+# 取值参考 data/sample-registrations.json 和 register.html 表单
+SURNAMES = '张王李赵刘陈杨黄周吴徐孙马朱胡郭何林罗高'
+GIVEN_NAMES = ['伟', '芳', '娜', '敏', '静', '磊', '洋', '勇', '艳', '杰', '子涵', '博通', '欣怡', '浩然', '雨萱']
+GENDERS = ['男', '女']
+PROVINCES = [('陕西省', '西安市'), ('北京市', '北京市'), ('上海市', '上海市'), ('广东省', '广州市'), ('四川省', '成都市')]
+SCHOOLS = ['长安二中', '西安中学', '北京四中', '华南师大附中', '成都七中']
+PROJECTS = ['新加坡', '马来西亚', '韩国', '俄罗斯', '0.5+2/3/4各校', '其他']
+COUNTRIES = ['新加坡', '马来西亚', '韩国', '俄罗斯', '美国', '英国']
+MAJORS = ['计算机科学', '大数据', '工商管理', '金融', '国际贸易', '艺术设计']
+EDUCATION_LEVELS = ['普通高中', '国际高中', '中专', '职高']
+
+ENDPOINTS = {
+    'submit-registration': ('POST', '/submit-registration'),
+    'contact': ('POST', '/api/contact'),
+    'stats': ('GET', '/api/stats'),
+    'trends-7': ('GET', '/api/trends?days=7'),
+    'trends-365': ('GET', '/api/trends?days=365&granularity=week'),
+    'registrations-page': ('GET', '/api/registrations?limit=20&page=1'),
+    'registrations-search': ('GET', '/api/registrations?q=%E5%BC%A0&limit=20'),
+}
+DEFAULT_ENDPOINTS = ['submit-registration', 'stats', 'trends-7', 'trends-365', 'registrations-page']
+
+
+def random_phone(rng):
+    return '1' + rng.choice('3456789') + ''.join(rng.choice('0123456789') for _ in range(9))
+
+
+def make_registration_form(rng):
+    """生成一份报名表单字段（与 register.html 提交的字段一致）。"""
+    province, city = rng.choice(PROVINCES)
+    name = rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES)
+    phone = random_phone(rng)
+    return {
+        'projects': rng.choice(PROJECTS),
+        'name': name,
+        'gender': rng.choice(GENDERS),
+        'ethnicity': '汉',
+        'province': province,
+        'city': city,
+        'phone': phone,
+        'email': f'{phone}@example.com',
+        'current_school': rng.choice(SCHOOLS),
+        'education_level': rng.choice(EDUCATION_LEVELS),
+        'graduation_time': f'{rng.randint(2024, 2027)}-06-30',
+        'gaokao_score': str(rng.randint(350, 720)),
+        'english_score': str(rng.randint(60, 150)),
+        'target_country': rng.choice(COUNTRIES),
+        'target_major': rng.choice(MAJORS),
+        'father_name': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+        'father_phone': random_phone(rng),
+        'application_date': datetime.date.today().isoformat(),
+    }
+
+
+def make_contact(rng):
+    return {'name': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES), 'phone': random_phone(rng), 'type': 'contact'}
+
+
+def synthetic_id(ms, i):
+    # 同一毫秒内的记录序号不同（按时间排序后相邻）
+    return (max(ms - ID_EPOCH_MS, 0) << 12) | (SYNTHETIC_WORKER_ID << 7) | (i % 128)
+
+
+def write_dataset(data_dir, size, seed):
+    """写入 size 条报名记录和 size // 10 条联系记录，提交时间分布在最近两年内。"""
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    start_ms = int((now - datetime.timedelta(days=730)).timestamp() * 1000)
+    end_ms = int(now.timestamp() * 1000)
+    os.makedirs(data_dir, exist_ok=True)
+
+    def write_array(path, count, build):
+        # 逐条写出，百万条记录也不需要一次性放进内存；格式与 json.dump(indent=2) 一致
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for i in range(count):
+                entry = json.dumps(build(i), ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                f.write((',\n  ' if i else '\n  ') + entry)
+            f.write('\n]' if count else ']')
+
+    timestamps = sorted(rng.randint(start_ms, end_ms) for _ in range(size))
+
+    def registration(i):
+        record = {'id': synthetic_id(timestamps[i], i),
+                  'submitTime': datetime.datetime.fromtimestamp(timestamps[i] / 1000).isoformat()}
+        record.update(make_registration_form(rng))
+        return record
+
+    def contact(i):
+        ts = timestamps[i * 10] if size else end_ms
+        record = {'id': synthetic_id(ts, i)}
+        record.update(make_contact(rng))
+        record['submitTime'] = datetime.datetime.fromtimestamp(ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        return record
+
+    write_array(os.path.join(data_dir, 'registrations.json'), size, registration)
+    write_array(os.path.join(data_dir, 'contacts.json'), size // 10, contact)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, args):
+    env = dict(os.environ,
+               SERVER_PORT=str(port),
+               SERVER_MODE=args.server_mode,
+               STORAGE_MODE=args.storage,
+               STATIC_BUILD='0',
+               IMAGE_PREBUILD='0',
+               METRICS_REPORT_INTERVAL='0',
+               PYTHONUNBUFFERED='1')
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, SERVER_SCRIPT], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server.py 启动失败，详见 {log.name}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=args.startup_timeout)
+            conn.request('GET', '/api/stats')
+            conn.getresponse().read()
+            conn.close()
+            return proc, log
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'server.py 在 {args.startup_timeout} 秒内没有就绪')
+
+
+def stop_server(proc, log):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    log.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_load(port, name, args, seed):
+    """用 concurrency 个线程（每个线程一条长连接）持续请求 duration 秒。"""
+    method, path = ENDPOINTS[name]
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            headers = {}
+            body = None
+            if name == 'submit-registration':
+                body = urllib.parse.urlencode(make_registration_form(rng)).encode('utf-8')
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            elif name == 'contact':
+                body = json.dumps(make_contact(rng), ensure_ascii=False).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+                else:
+                    local.append(time.perf_counter() - start)
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'endpoint': name,
+        'method': method,
+        'path': path,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'duration': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(SERVER_SCRIPT),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """与基线结果比较：吞吐量下降或 p95 上升超过 threshold（百分比）记为退化。"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['size'], r['endpoint']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        base = baseline.get((r['size'], r['endpoint']))
+        if not base:
+            continue
+        checks = [('throughput', base['throughput'], r['throughput'], -1),
+                  ('p95', base['latency_ms']['p95'], r['latency_ms']['p95'], 1)]
+        for metric, before, after, direction in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            flag = change * direction > threshold
+            print(f"{r['size']:>8} {r['endpoint']:<22} {metric:<10} {before:>10} -> {after:<10} "
+                  f"{change:+.1f}%{'  ⚠️ 退化' if flag else ''}", file=sys.stderr)
+            if flag:
+                regressions.append((r['size'], r['endpoint'], metric, round(change, 1)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='server.py 基准测试')
+    parser.add_argument('--sizes', default='1000,10000', help='数据量档位，逗号分隔（默认 1000,10000）')
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS),
+                        help=f'要测试的接口，可选: {", ".join(ENDPOINTS)}')
+    parser.add_argument('--duration', type=float, default=10, help='每个接口施压的秒数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发连接数')
+    parser.add_argument('--server-mode', default='threaded', help='SERVER_MODE')
+    parser.add_argument('--storage', default='json', help='STORAGE_MODE')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子，相同种子生成相同数据')
+    parser.add_argument('--startup-timeout', type=float, default=300, help='等待服务器就绪的秒数')
+    parser.add_argument('--output', help='结果写入的文件（默认输出到标准输出）')
+    parser.add_argument('--compare', help='基线结果文件')
+    parser.add_argument('--threshold', type=float, default=10, help='判定退化的百分比阈值')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录（数据和服务器日志）')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f'未知接口: {", ".join(unknown)}')
+
+    results = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f'bench-{size}-')
+        try:
+            print(f'生成 {size} 条报名记录...', file=sys.stderr)
+            write_dataset(os.path.join(workdir, 'data'), size, args.seed)
+            port = free_port()
+            started = time.perf_counter()
+            proc, log = start_server(workdir, port, args)
+            startup = round(time.perf_counter() - started, 3)
+            try:
+                for name in endpoints:
+                    print(f'  {size:>8} 条  {name}', file=sys.stderr)
+                    result = run_load(port, name, args, args.seed)
+                    result.update({'size': size, 'startup_seconds': startup})
+                    results.append(result)
+            finally:
+                stop_server(proc, log)
+        finally:
+            if args.keep:
+                print(f'  临时目录: {workdir}', file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'server_mode': args.server_mode,
+            'storage': args.storage,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,87 +2,3391 @@
 # -*- coding: utf-8 -*-
 
 import http.server
+import socket
 import socketserver
 import json
 import os
+import posixpath
+import queue
+import select
+import selectors
+import random
 import urllib.parse
 import datetime
+import email.utils
+import functools
+import cProfile
 import csv
+import gzip
+import hashlib
 import io
+import itertools
+import mmap
+import asyncio
+import atexit
+import base64
+import bisect
+import re
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
-PORT = 8000
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只使用进程内锁
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip 压缩
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps, features as image_features
+except ImportError:  # 可选依赖，未安装时只提供已经生成好的图片副本
+    Image = None
+
+PORT = int(os.environ.get('SERVER_PORT', 8000))
 DATA_DIR = "data"
 UPLOADS_DIR = "uploads"
 REGISTRATIONS_FILE = os.path.join(DATA_DIR, "registrations.json")
 CONTACTS_FILE = os.path.join(DATA_DIR, "contacts.json")
 
-# 确保目录存在
-Path(DATA_DIR).mkdir(exist_ok=True)
-Path(UPLOADS_DIR).mkdir(exist_ok=True)
+# 并发模式: single（单线程）、threaded（有界线程池）、prefork（多进程共享监听套接字）、
+# asyncio（事件循环处理连接和收发，线程池执行请求处理）
+SERVER_MODE = os.environ.get('SERVER_MODE', 'threaded')
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 16))
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', 128))
+# 默认进程数不超过记录 ID 中工作进程号的个数（32，见 IdGenerator）
+SERVER_PROCESSES = int(os.environ.get('SERVER_PROCESSES', min(os.cpu_count() or 2, 32)))
+# HTTP/1.1 长连接：空闲超过 KEEPALIVE_TIMEOUT 秒或处理满 KEEPALIVE_MAX_REQUESTS 个请求后关闭连接
+HTTP_KEEPALIVE = os.environ.get('HTTP_KEEPALIVE', '1') == '1'
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 5))
+KEEPALIVE_MAX_REQUESTS = int(os.environ.get('KEEPALIVE_MAX_REQUESTS', 100))
+# 线程池引擎：长连接处理完一个请求后最多等待 KEEPALIVE_PARK_DELAY 秒，下一个请求还没到就把连接交给空闲连接监视线程
+KEEPALIVE_PARK_DELAY = float(os.environ.get('KEEPALIVE_PARK_DELAY', 0.01))
+# 请求体大小上限（所有引擎、所有路由），超过时不读取请求体，直接返回 413 并关闭连接；
+# 不支持分块传输编码的请求体（Transfer-Encoding），这类请求返回 411，客户端需要带 Content-Length 重发
+REQUEST_MAX_BYTES = int(os.environ.get('REQUEST_MAX_BYTES', 20 * 1024 * 1024))
+# asyncio 模式：请求头大小上限、读取请求体的超时时间、每个连接未发送数据的上限
+ASYNC_MAX_HEADER = int(os.environ.get('ASYNC_MAX_HEADER', 64 * 1024))
+REQUEST_BODY_TIMEOUT = float(os.environ.get('REQUEST_BODY_TIMEOUT', 60))
+ASYNC_MAX_PENDING = int(os.environ.get('ASYNC_MAX_PENDING', 1024 * 1024))
+
+# 指标：请求耗时直方图的分桶（秒）；性能报告写入 logs/app.log 的间隔（秒，0 表示不写）；超过阈值（秒）的请求记为慢请求
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_REPORT_INTERVAL = float(os.environ.get('METRICS_REPORT_INTERVAL', 3600))
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+LOG_DIR = "logs"
+APP_LOG_FILE = os.path.join(LOG_DIR, "app.log")
+
+# 日志由后台线程批量写入：队列满时丢弃并计数；LOG_FLUSH_INTERVAL 秒写一次文件；
+# 文件超过 LOG_MAX_BYTES 字节或写满 LOG_ROTATE_INTERVAL 秒（0 表示不按时间轮转）后轮转，保留 LOG_BACKUPS 个旧文件
+# LOG_FORMAT 为 text（与 Node 端 app.log 相同）或 json（每行一个 JSON 对象）
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 1.0))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_ROTATE_INTERVAL = float(os.environ.get('LOG_ROTATE_INTERVAL', 86400))
+LOG_BACKUPS = int(os.environ.get('LOG_BACKUPS', 5))
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_CONSOLE = os.environ.get('LOG_CONSOLE', '1') == '1'
+ACCESS_LOG = os.environ.get('ACCESS_LOG', '1') == '1'
+
+# 性能剖析（默认关闭）：PROFILE_MODE 为 cprofile 或 stack 时，按 PROFILE_SAMPLE_RATE 的比例抽样
+# PROFILE_ROUTES 中的路由（为空表示全部），结果写入 PROFILE_DIR；也可以通过 /api/profiling 在运行时开关
+PROFILE_MODE = os.environ.get('PROFILE_MODE', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+PROFILE_ROUTES = os.environ.get('PROFILE_ROUTES', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(LOG_DIR, "profiles"))
+PROFILE_STACK_INTERVAL = float(os.environ.get('PROFILE_STACK_INTERVAL', 0.002))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+
+# 存储模式: json（JSON 数组文件）、journal（追加写日志 + 定期合并快照）、sqlite（SQLite 数据库）
+STORAGE_MODE = os.environ.get('STORAGE_MODE', 'json')
+# 日志落盘策略: always（每条 fsync）、interval（后台定期 fsync）、never（交给操作系统）
+JOURNAL_FSYNC = os.environ.get('JOURNAL_FSYNC', 'interval')
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get('JOURNAL_FSYNC_INTERVAL', 1.0))
+JOURNAL_COMPACT_INTERVAL = float(os.environ.get('JOURNAL_COMPACT_INTERVAL', 300))
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('JOURNAL_COMPACT_THRESHOLD', 5000))
+SQLITE_FILE = os.environ.get('SQLITE_FILE', os.path.join(DATA_DIR, "dingfeng.sqlite3"))
+
+# /api/trends 支持分组统计的字段
+TREND_GROUP_FIELDS = ('projects', 'target_country')
+# 列表接口支持的排序字段、q 参数搜索的字段，以及分页上限
+LIST_SORT_FIELDS = ('submitTime', 'name', 'phone', 'email')
+LIST_SEARCH_FIELDS = ('name', 'phone', 'email')
+LIST_DEFAULT_LIMIT = 20
+LIST_MAX_LIMIT = 500
+# 带其中任一参数时列表接口才返回分页结构；其他参数（如防缓存的 _=时间戳）忽略，仍返回全部数据
+LIST_QUERY_PARAMS = ('page', 'limit', 'cursor', 'sort', 'from', 'to', 'q', 'fields')
+
+# 导出接口的列（字段, 表头），与管理后台原来在浏览器里生成的 CSV 相同
+EXPORT_COLUMNS = {
+    'registrations': (
+        ('id', 'ID'), ('submitTime', '提交时间'), ('name', '姓名'), ('gender', '性别'), ('ethnicity', '民族'),
+        ('phone', '电话'), ('email', '邮箱'), ('id_number', '身份证号'), ('province', '户籍省份'), ('city', '户籍城市'),
+        ('political_status', '政治面貌'), ('home_address', '家庭地址'), ('projects', '报名项目'),
+        ('current_school', '就读学校'), ('graduation_time', '毕业时间'), ('education_level', '学历'),
+        ('diploma', '是否有毕业证'), ('gaokao_score', '高考成绩'), ('english_score', '英语成绩'),
+        ('target_country', '意向国家'), ('target_major', '意向专业'), ('father_name', '父亲姓名'),
+        ('father_phone', '父亲电话'), ('mother_name', '母亲姓名'), ('mother_phone', '母亲电话'),
+        ('emergency_contact', '其他联系电话'), ('medical_history', '过敏史/病史'), ('special_note', '特别声明'),
+        ('applicant_signature', '申请人签名'), ('application_date', '申请日期'),
+    ),
+    'contacts': (('id', 'ID'), ('submitTime', '提交时间'), ('name', '姓名'), ('phone', '电话'), ('type', '类型')),
+}
+CONTACT_TYPE_LABELS = {'contact': '预约探校', 'callback': '回电申请'}
+# 流式响应（导出、NDJSON）每积累 STREAM_CHUNK_SIZE 字节发送一个分块
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 批量导入：请求体大小与行数上限、响应中最多列出的错误行数、上传文件超过 IMPORT_SPOOL_SIZE 字节时转存到临时文件
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 20 * 1024 * 1024))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', 100000))
+IMPORT_MAX_ERRORS = 100
+IMPORT_SPOOL_SIZE = 1024 * 1024
+# 记录 ID：53 位整数（JavaScript 的 Number 能精确表示），由 ID_EPOCH_MS 起的毫秒数、5 位工作进程号和 7 位序号组成；
+# 多个服务实例写同一份数据时用 ID_WORKER_ID 给它们分配不同的进程号，prefork 子进程依次使用 ID_WORKER_ID + 序号
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+ID_WORKER_ID = int(os.environ.get('ID_WORKER_ID', 0))
+
+# 重复提交检测：DEDUPE_WINDOW 秒内姓名相同、且电话或邮箱（规范化后）也相同的提交视为重复（0 表示不检测）；
+# DEDUPE_MODE 为 merge（默认，把新填写的字段合并进首次提交的记录）、reject（不保存，返回 409）、
+# flag（照常保存并在记录和响应中标出 duplicateOf，这些记录不计入统计）或 off（不检测）
+DEDUPE_WINDOW = float(os.environ.get('DEDUPE_WINDOW', 300))
+DEDUPE_MODE = os.environ.get('DEDUPE_MODE', 'merge')
+# 带 Idempotency-Key 请求头的提交在 IDEMPOTENCY_TTL 秒内用同一个键重试，直接返回首次的响应；
+# 键保存在数据目录的 IDEMPOTENCY_FILE 中，多进程共用；同一个键正在处理时重试最多等待 IDEMPOTENCY_WAIT 秒
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 10))
+IDEMPOTENCY_FILE = os.environ.get('IDEMPOTENCY_FILE', os.path.join(DATA_DIR, "idempotency.jsonl"))
+# 导入时的字段校验，与 config/security.js 的规则一致
+NAME_PATTERN = re.compile(r'^[\u4e00-\u9fa5a-zA-Z\s·]{2,50}$')
+PHONE_PATTERN = re.compile(r'^1[3-9]\d{9}$')
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# 导入文件的表头 -> 字段名：导出文件的中文表头，以及 data/sample-*.csv 使用的字段名
+IMPORT_FIELD_ALIASES = {
+    kind: {header: field for field, header in columns} for kind, columns in EXPORT_COLUMNS.items()
+}
+IMPORT_FIELD_ALIASES['registrations'].update({
+    'idCard': 'id_number', 'school': 'current_school', 'education': 'education_level',
+    'graduationYear': 'graduation_time', 'applicationProject': 'projects', 'targetCountry': 'target_country',
+    'targetMajor': 'target_major', 'address': 'home_address',
+})
+
+# 响应压缩与缓存：小于 COMPRESS_MIN_SIZE 字节的响应不压缩
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 300))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# 静态资源构建：预压缩文本文件、为资源文件名加内容哈希，产物放在 STATIC_BUILD_DIR
+STATIC_BUILD = os.environ.get('STATIC_BUILD', '1') == '1'
+STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR', '.static-build')
+STATIC_TEXT_EXTS = ('.html', '.htm', '.css', '.js', '.svg', '.json', '.txt', '.xml')
+STATIC_BINARY_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2', '.ttf')
+STATIC_SKIP_DIRS = {'node_modules', DATA_DIR, UPLOADS_DIR, 'logs', 'utils', 'config'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 图片副本：按宽度缩小并生成 WebP，按请求的 Accept 头和 w 参数选择，生成结果缓存在 IMAGE_CACHE_DIR
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+IMAGE_DIRS = ('images',)
+IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.environ.get('IMAGE_WIDTHS', '320,640,960,1280,1920').split(',')))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '.image-cache')
+IMAGE_PREBUILD = os.environ.get('IMAGE_PREBUILD', '1') == '1'
+
+# 静态文件内存缓存：只缓存不超过 STATIC_CACHE_MAX_FILE 的小文件，总量超过 STATIC_CACHE_MAX_BYTES 时淘汰最久未用的
+STATIC_CACHE_MAX_BYTES = int(os.environ.get('STATIC_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+STATIC_CACHE_MAX_FILE = int(os.environ.get('STATIC_CACHE_MAX_FILE', 256 * 1024))
+# 其余文件（大图片等）用 sendfile 由内核直接发送
+STATIC_SENDFILE = os.environ.get('STATIC_SENDFILE', '1') == '1'
+# 一个 Range 请求最多允许的范围个数，超过时忽略 Range 返回完整内容
+RANGE_MAX_PARTS = int(os.environ.get('RANGE_MAX_PARTS', 16))
+
+# 确保目录存在
+Path(DATA_DIR).mkdir(exist_ok=True)
+Path(UPLOADS_DIR).mkdir(exist_ok=True)
+
+# 每个数据文件一把进程内锁；多进程模式下再叠加 flock 文件锁
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+_file_locks_held = threading.local()
+
+@contextmanager
+def file_lock(path):
+    held = _file_locks_held.__dict__.setdefault('paths', set())
+    if path in held:
+        # 同一线程重入时不再重复加锁
+        yield
+        return
+    with _file_locks_guard:
+        lock = _file_locks.setdefault(path, threading.Lock())
+    with lock:
+        held.add(path)
+        try:
+            if fcntl is None:
+                yield
+                return
+            with open(path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            held.discard(path)
+
+class AsyncLogger:
+    """后台线程写日志：请求线程只把记录放进有界队列，格式化、写文件和轮转都在写入线程中完成。
+
+    行格式与 Node 端 utils/logger.js 相同（[时间] [级别] 消息 | {JSON}），LOG_FORMAT=json 时每行一个 JSON 对象。
+    INFO/WARN/ERROR 写入 app.log（ERROR 同时写入 error.log），访问日志写入 access.log。
+    队列满时直接丢弃并计数，不会阻塞请求。
+    """
+
+    FILES = {'app': 'app.log', 'error': 'error.log', 'access': 'access.log'}
+
+    def __init__(self, directory, queue_size, flush_interval, max_bytes, rotate_interval, backups,
+                 fmt='text', console=True):
+        self.directory = directory
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.fmt = fmt
+        self.console = console
+        self.dropped = 0
+        self._reported_drops = 0
+        self._reset()
+
+    def _reset(self):
+        # fork 之后子进程不继承写入线程，也不能沿用父进程的队列和未写出的缓冲
+        self._queue = queue.Queue(self.queue_size)
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._files = {}
+        self._buffers = {}
+
+    def log(self, level, message, meta=None, target='app'):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((target, time.time(), level, message, meta))
+        except queue.Full:
+            self.dropped += 1
+        if self._queue.qsize() > self.queue_size // 2:
+            self._wakeup.set()
+
+    def access(self, meta):
+        self.log('ACCESS', 'HTTP Request', meta, 'access')
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'queueSize': self.queue_size, 'dropped': self.dropped}
+
+    def close(self, timeout=5):
+        """写出队列中剩余的日志并停止写入线程。"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        thread.join(timeout)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def format(self, timestamp, level, message, meta):
+        ts = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        if self.fmt == 'json':
+            entry = {'timestamp': ts, 'level': level, 'message': message}
+            if meta:
+                entry['meta'] = meta
+            return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+        meta_str = f" | {json.dumps(meta, ensure_ascii=False, separators=(',', ':'), default=str)}" if meta else ''
+        return f"[{ts}] [{level}] {message}{meta_str}"
+
+    def _run(self):
+        # 每隔 flush_interval 秒取空队列并写出一次；队列过半时提前唤醒
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            stop = self._stopping
+            try:
+                while True:
+                    self._write(*self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if self.dropped != self._reported_drops:
+                count, self._reported_drops = self.dropped - self._reported_drops, self.dropped
+                self._write('app', time.time(), 'WARN', f'日志队列已满，丢弃了 {count} 条日志', {'dropped': self.dropped})
+            self._flush()
+            if stop:
+                return
+
+    def _write(self, target, timestamp, level, message, meta):
+        try:
+            line = self.format(timestamp, level, message, meta)
+        except (TypeError, ValueError) as e:
+            line = self.format(timestamp, level, message, {'formatError': str(e)})
+        if self.console:
+            stream = sys.stdout if level == 'INFO' else sys.stderr
+            stream.write(line + '\n')
+        data = (line + '\n').encode('utf-8')
+        self._buffers.setdefault(target, []).append(data)
+        if level == 'ERROR' and target == 'app':
+            self._buffers.setdefault('error', []).append(data)
+
+    def _flush(self):
+        if self.console:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        for target, chunks in self._buffers.items():
+            if not chunks:
+                continue
+            data = b''.join(chunks)
+            chunks.clear()
+            try:
+                fd = self._open(target, len(data))
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                self._files[target][2] += len(data)
+            except OSError as e:
+                sys.stderr.write(f"写入日志文件失败: {e}\n")
+
+    def _open(self, target, incoming):
+        """返回日志文件描述符；文件被其他进程轮转过则重新打开，超过大小或时间限制时先轮转。"""
+        path = os.path.join(self.directory, self.FILES[target])
+        entry = self._files.get(target)
+        if entry is not None:
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != entry[1]:
+                os.close(self._files.pop(target)[0])
+                entry = None
+        if entry is not None and self._should_rotate(entry, incoming):
+            with file_lock(path):
+                # 多进程共享日志文件时只由第一个发现需要轮转的进程执行
+                try:
+                    if os.stat(path).st_ino == entry[1]:
+                        self._rotate(path)
+                except FileNotFoundError:
+                    pass
+            os.close(entry[0])
+            del self._files[target]
+            entry = None
+        if entry is None:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            st = os.fstat(fd)
+            entry = self._files[target] = [fd, st.st_ino, st.st_size, time.time()]
+        return entry[0]
+
+    def _should_rotate(self, entry, incoming):
+        if self.max_bytes > 0 and entry[2] > 0 and entry[2] + incoming > self.max_bytes:
+            return True
+        return self.rotate_interval > 0 and time.time() - entry[3] >= self.rotate_interval and entry[2] > 0
+
+    def _rotate(self, path):
+        # app.log -> app.log.1 -> app.log.2 ...，超过 backups 个的删除
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{i}'):
+                os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+        if self.backups > 0:
+            os.replace(path, f'{path}.1')
+        else:
+            os.remove(path)
+
+LOGGER = AsyncLogger(LOG_DIR, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL,
+                     LOG_BACKUPS, LOG_FORMAT, LOG_CONSOLE)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=LOGGER._reset)
+atexit.register(LOGGER.close)
+
+def write_app_log(level, message, meta=None):
+    """按 Node 端 logger 的格式记录一行到 logs/app.log：[时间] [级别] 消息 | {JSON}"""
+    LOGGER.log(level, message, meta)
+
+def _read_cpu_times():
+    # 返回 (空闲, 总计) 时间片；非 Linux 系统没有 /proc/stat，返回 None
+    try:
+        with open('/proc/stat') as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    return values[3] + (values[4] if len(values) > 4 else 0), sum(values)
+
+def _read_memory_usage():
+    try:
+        info = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                info[name] = int(value.split()[0])
+        return (info['MemTotal'] - info['MemAvailable']) / info['MemTotal'] * 100
+    except (OSError, ValueError, KeyError, ZeroDivisionError):
+        return 0.0
+
+def format_uptime(seconds):
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{days}天 {hours}小时 {minutes}分钟 {secs}秒"
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    """进程内的请求和存储指标：计数器、耗时直方图和进行中的请求数。
+
+    render() 输出 Prometheus 文本格式；report() 生成与 Node 端 utils/monitor.js 相同结构的性能报告。
+    prefork 模式下每个进程各自统计。
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}
+        self.latency = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+        self.storage = {}
+        self.total = 0
+        self.success = 0
+        self.error = 0
+        # 与 Node 端一致，性能报告的分位数取最近 1000 次请求
+        self.recent = deque(maxlen=1000)
+        self._reporter_pid = None
+        self._cpu_sample = None
+
+    def _observe(self, histograms, key, seconds):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(self.buckets) + 3)
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def request_started(self):
+        self._ensure_reporter()
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method, route, status, seconds, bytes_in, bytes_out):
+        with self._lock:
+            self.in_flight -= 1
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._observe(self.latency, (method, route), seconds)
+            self.bytes_in[route] = self.bytes_in.get(route, 0) + bytes_in
+            self.bytes_out[route] = self.bytes_out.get(route, 0) + bytes_out
+            self.total += 1
+            if 200 <= status < 400:
+                self.success += 1
+            else:
+                self.error += 1
+            self.recent.append(seconds * 1000)
+
+    def observe_storage(self, store, op, seconds):
+        with self._lock:
+            self._observe(self.storage, (store, op), seconds)
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, label_names, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, values in sorted(histograms.items()):
+                labels = ','.join(f'{n}="{_escape_label(v)}"' for n, v in zip(label_names, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values[-1]}')
+                lines.append(f'{name}_sum{{{labels}}} {values[-2]:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {values[-1]}')
+
+        def counter(name, help_text, label_names, counts, metric_type='counter'):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for key, value in sorted(counts.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                labels = ','.join(f'{n}="{_escape_label(v)}"' for n, v in zip(label_names, key))
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+        with self._lock:
+            counter('http_requests_total', '按路由和状态码统计的请求数', ('method', 'route', 'status'), self.requests)
+            histogram('http_request_duration_seconds', '请求处理耗时', ('method', 'route'), self.latency)
+            counter('http_requests_in_flight', '正在处理的请求数', (), {(): self.in_flight}, 'gauge')
+            counter('http_request_bytes_total', '请求体字节数', ('route',), self.bytes_in)
+            counter('http_response_bytes_total', '响应体字节数', ('route',), self.bytes_out)
+            histogram('storage_operation_duration_seconds', '数据文件读写耗时', ('store', 'op'), self.storage)
+        cache = STATIC_CACHE.stats()
+        counter('static_cache_hits_total', '静态文件内存缓存命中次数', (), {(): cache['hits']})
+        counter('static_cache_misses_total', '静态文件内存缓存未命中次数', (), {(): cache['misses']})
+        counter('static_cache_evictions_total', '静态文件内存缓存淘汰次数', (), {(): cache['evictions']})
+        counter('static_cache_bytes', '静态文件内存缓存占用字节数', (), {(): cache['bytes']}, 'gauge')
+        counter('static_sendfile_bytes_total', '通过 sendfile 发送的字节数', (), {(): cache['sendfile']['bytes']})
+        log_stats = LOGGER.stats()
+        counter('log_queue_length', '等待写入的日志条数', (), {(): log_stats['queued']}, 'gauge')
+        counter('log_dropped_total', '日志队列已满时丢弃的日志条数', (), {(): log_stats['dropped']})
+        counter('process_start_time_seconds', '进程启动时间', (), {(): f'{self.started:.3f}'}, 'gauge')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """生成性能报告，字段与 Node 端 utils/monitor.js 的 generatePerformanceReport 相同。"""
+        cpu = _read_cpu_times()
+        cpu_usage = 0.0
+        if cpu and self._cpu_sample and cpu[1] > self._cpu_sample[1]:
+            idle = cpu[0] - self._cpu_sample[0]
+            total = cpu[1] - self._cpu_sample[1]
+            cpu_usage = 100 - idle / total * 100
+        self._cpu_sample = cpu
+
+        with self._lock:
+            total, success, error = self.total, self.success, self.error
+            recent = sorted(self.recent)
+        avg = sum(recent) / len(recent) if recent else 0
+        if recent:
+            n = len(recent)
+            response_times = {
+                'min': f'{recent[0]:.2f}ms',
+                'max': f'{recent[-1]:.2f}ms',
+                'median': f'{recent[n // 2]:.2f}ms',
+                'p95': f'{recent[int(n * 0.95)]:.2f}ms',
+                'p99': f'{recent[int(n * 0.99)]:.2f}ms',
+            }
+        else:
+            response_times = {'min': 0, 'max': 0, 'median': 0, 'p95': 0, 'p99': 0}
+        return {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'requests': {
+                'total': total,
+                'success': success,
+                'error': error,
+                'successRate': f'{success / total * 100:.2f}%' if total else '0%',
+                'avgResponseTime': f'{avg:.2f}ms',
+            },
+            'system': {
+                'cpuUsage': f'{cpu_usage:.2f}%',
+                'memoryUsage': f'{_read_memory_usage():.2f}%',
+                'uptime': format_uptime(time.time() - self.started),
+                'platform': sys.platform,
+                'pythonVersion': sys.version.split()[0],
+                'pid': os.getpid(),
+            },
+            'responseTimes': response_times,
+        }
+
+    def _ensure_reporter(self):
+        # 与日志合并线程相同，fork 之后按进程懒启动
+        if self._reporter_pid == os.getpid() or METRICS_REPORT_INTERVAL <= 0:
+            return
+        self._reporter_pid = os.getpid()
+        self._cpu_sample = _read_cpu_times()
+        threading.Thread(target=self._report_loop, name='metrics-reporter', daemon=True).start()
+
+    def _report_loop(self):
+        while True:
+            time.sleep(METRICS_REPORT_INTERVAL)
+            try:
+                write_app_log('INFO', '性能报告', self.report())
+            except Exception as e:
+                write_app_log('ERROR', '写入性能报告时出错', {'error': str(e)})
+
+METRICS = Metrics()
+
+def timed_storage(op):
+    """记录存储操作耗时的装饰器；被装饰函数的第一个参数是文件路径，或带 path 属性的存储对象。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(target, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(target, *args, **kwargs)
+            finally:
+                path = getattr(target, 'path', target)
+                METRICS.observe_storage(os.path.basename(path), op, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+@timed_storage('read')
+def read_json_list(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@timed_storage('write')
+def write_json_atomic(path, data):
+    # 先写临时文件再原子替换，避免并发读取到写了一半的文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class IdGenerator:
+    """Snowflake 风格的 ID 生成器：(毫秒 << 12) | (工作进程号 << 7) | 序号。
+
+    同一进程内由锁保证单调递增，不同进程的工作进程号不同，因此跨线程、跨进程都不会重复。
+    同一毫秒内的 128 个序号用完或系统时钟回拨时不等待，直接借用下一毫秒。
+    """
+
+    WORKER_BITS = 5
+    SEQUENCE_BITS = 7
+
+    def __init__(self, worker):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self.set_worker(worker)
+
+    def set_worker(self, worker):
+        # 取模会让两个进程用上同一个工作进程号，超出范围时直接报错
+        if not 0 <= worker < 1 << self.WORKER_BITS:
+            raise ValueError(f'工作进程号 {worker} 超出范围 0-{(1 << self.WORKER_BITS) - 1}')
+        self.worker = worker
+
+    def next_id(self):
+        now = time.time_ns() // 1_000_000 - ID_EPOCH_MS
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence >> self.SEQUENCE_BITS:
+                    self._last_ms += 1
+                    self._sequence = 0
+            ms, sequence = self._last_ms, self._sequence
+        return (ms << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker << self.SEQUENCE_BITS) | sequence
+
+ID_GENERATOR = IdGenerator(ID_WORKER_ID)
+
+def record_id(record):
+    # 旧数据可能只有 timestamp 字段，统一转成字符串比较
+    return str(record.get('id', record.get('timestamp', '')))
+
+_DAY_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+def submit_day(submit_time):
+    # submitTime 有 ISO 格式和 "%Y-%m-%d %H:%M:%S" 两种，前 10 位都是日期
+    if isinstance(submit_time, str) and _DAY_PATTERN.match(submit_time):
+        return submit_time[:10]
+    return None
+
+def split_values(value):
+    # 多选字段可能是列表，也可能是逗号分隔的字符串
+    if isinstance(value, list):
+        return [str(v).strip() for v in value]
+    if ',' in str(value):
+        return [v.strip() for v in str(value).split(',')]
+    return [value]
+
+def counts_in_stats(record):
+    # DEDUPE_MODE=flag 保存的重复提交带 duplicateOf，不计入统计和趋势
+    return record.get('duplicateOf') is None
+
+def stats_total(categories):
+    # 每条计入统计的记录在课程分布中恰好计一次，总数由计数得到，不用遍历记录
+    return sum(categories['byCourse'].values())
+
+class DayCountIndex:
+    """按提交日期维护的计数索引，可同时按若干字段分组计数。"""
+
+    def __init__(self, group_fields=()):
+        self.group_fields = tuple(group_fields)
+        self.days = {}
+        self.groups = {field: {} for field in self.group_fields}
+
+    def rebuild(self, records):
+        self.days = {}
+        self.groups = {field: {} for field in self.group_fields}
+        for record in records:
+            self.add(record)
+
+    def add(self, record, delta=1):
+        day = submit_day(record.get('submitTime'))
+        if not day or not counts_in_stats(record):
+            return
+        self.days[day] = self.days.get(day, 0) + delta
+        if not self.days[day]:
+            del self.days[day]
+        for field in self.group_fields:
+            buckets = self.groups[field].setdefault(day, {})
+            for value in split_values(record.get(field) or '其他'):
+                buckets[value] = buckets.get(value, 0) + delta
+                if not buckets[value]:
+                    del buckets[value]
+            if not buckets:
+                del self.groups[field][day]
+
+    def remove(self, record):
+        self.add(record, -1)
+
+    def snapshot(self, group=None):
+        if group is None:
+            return dict(self.days)
+        return {day: dict(values) for day, values in self.groups.get(group, {}).items()}
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key), ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError('cursor 参数错误')
+    return tuple(key)
+
+def parse_list_query(query_params):
+    """解析列表接口的分页、排序、筛选参数，参数不合法时抛出 ValueError。"""
+    def param(name, default=None):
+        return query_params.get(name, [default])[0]
+
+    sort = param('sort', '-submitTime')
+    desc = sort.startswith('-')
+    sort_field = sort.lstrip('-+')
+    if sort_field not in LIST_SORT_FIELDS:
+        raise ValueError(f'不支持的排序字段: {sort_field}')
+    limit = int(param('limit', LIST_DEFAULT_LIMIT))
+    page = int(param('page', 1))
+    if limit < 1 or page < 1:
+        raise ValueError('page 和 limit 必须大于 0')
+    date_from = param('from')
+    date_to = param('to')
+    for value in (date_from, date_to):
+        if value is not None:
+            datetime.date.fromisoformat(value)
+    cursor = param('cursor')
+    fields = param('fields')
+    return {
+        'sort_field': sort_field,
+        'desc': desc,
+        'limit': min(limit, LIST_MAX_LIMIT),
+        'page': page,
+        'offset': 0 if cursor else (page - 1) * min(limit, LIST_MAX_LIMIT),
+        'cursor': decode_cursor(cursor) if cursor else None,
+        'from': date_from,
+        'to': date_to,
+        'q': (param('q') or '').strip().lower() or None,
+        'fields': [f for f in fields.split(',') if f] if fields else None,
+    }
+
+def sort_value(record, field):
+    value = record.get(field)
+    return '' if value is None else str(value)
+
+def match_record(record, spec):
+    if spec['from'] or spec['to']:
+        day = submit_day(record.get('submitTime'))
+        if not day or (spec['from'] and day < spec['from']) or (spec['to'] and day > spec['to']):
+            return False
+    if spec['q']:
+        return any(spec['q'] in sort_value(record, f).lower() for f in LIST_SEARCH_FIELDS)
+    return True
+
+def project_record(record, fields):
+    if not fields:
+        return record
+    return {f: record[f] for f in fields if f in record}
+
+def export_value(record, field):
+    value = record.get(field)
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(str(v) for v in value)
+    value = str(value)
+    if field == 'submitTime':
+        return value.replace('T', ' ')[:19]
+    if field == 'type':
+        return CONTACT_TYPE_LABELS.get(value, value)
+    return value
+
+def iter_ndjson(records, fields=None):
+    """每行一条 JSON 记录，每积累 STREAM_CHUNK_SIZE 字节产出一段。"""
+    lines = []
+    size = 0
+    for record in records:
+        line = json.dumps(project_record(record, fields), ensure_ascii=False).encode('utf-8') + b'\n'
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield b''.join(lines)
+            lines = []
+            size = 0
+    yield b''.join(lines)
+
+def gzip_chunks(chunks):
+    # 每段之后做一次同步刷新，客户端收到一段就能解压出完整的行
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def iter_csv_export(records, columns):
+    """逐行生成 CSV，每积累 STREAM_CHUNK_SIZE 个字符产出一段 UTF-8 字节。"""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')  # BOM，Excel 才能识别 UTF-8
+    writer = csv.writer(buffer)
+    writer.writerow([header for _, header in columns])
+    for record in records:
+        row = []
+        for field, _ in columns:
+            value = export_value(record, field)
+            # 以 = + - @ 开头的单元格会被表格软件当作公式执行
+            if value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+                value = "'" + value
+            row.append(value)
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XLSX_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_XLSX_STATIC_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     f'<Relationships xmlns="{_XLSX_PKG_REL_NS}">'
+     f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     f'<Relationships xmlns="{_XLSX_PKG_REL_NS}">'
+     f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+     f'<Relationship Id="rId2" Type="{_XLSX_REL_NS}/styles" Target="styles.xml"/>'
+     '</Relationships>'),
+    # 两种单元格样式：0 为默认，1 为表头加粗
+    ('xl/styles.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     f'<styleSheet xmlns="{_XLSX_MAIN_NS}">'
+     '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+     '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+     '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+     '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+     '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+     '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+     '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+     '</styleSheet>'),
+)
+
+class _ChunkSink:
+    """zipfile 的输出目标：没有 seek/tell，zipfile 会以流式方式写出（数据描述符放在每个文件之后）。"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return data
+
+def xlsx_escape(value):
+    value = _XML_INVALID_CHARS.sub('', value)
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def xlsx_row(values, style=0):
+    cell_start = f'<c t="inlineStr" s="{style}">' if style else '<c t="inlineStr">'
+    cells = ''.join(f'{cell_start}<is><t xml:space="preserve">{xlsx_escape(v)}</t></is></c>' for v in values)
+    return f'<row>{cells}</row>'.encode('utf-8')
+
+def iter_xlsx_export(records, columns, sheet_name):
+    """逐行生成 XLSX：单元格使用内联字符串（不需要预先收集共享字符串表），工作表边压缩边产出。"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS:
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml',
+                         '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         f'<workbook xmlns="{_XLSX_MAIN_NS}" xmlns:r="{_XLSX_REL_NS}">'
+                         f'<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        f'<worksheet xmlns="{_XLSX_MAIN_NS}"><sheetData>'.encode('utf-8'))
+            sheet.write(xlsx_row([header for _, header in columns], style=1))
+            for record in records:
+                sheet.write(xlsx_row([export_value(record, field) for field, _ in columns]))
+                if sink.size >= STREAM_CHUNK_SIZE:
+                    yield sink.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.take()
+
+class RequestBody:
+    """按 Content-Length 限长读取请求体，读完后标记给处理器，连接可以继续复用。"""
+
+    def __init__(self, handler, length):
+        self.handler = handler
+        self.remaining = length
+        if length == 0:
+            handler._body_read = True
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.handler.rfile.read(size)
+        if not data:
+            raise ValueError('请求体不完整')
+        self.remaining -= len(data)
+        if self.remaining == 0:
+            self.handler._body_read = True
+        return data
+
+class _PrefixedReader(io.RawIOBase):
+    # 先返回已经读出的开头部分，再继续读底层流，用于嗅探编码和格式之后再交给 TextIOWrapper
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._head[:len(buffer)] if self._head else self._stream.read(len(buffer))
+        self._head = self._head[len(data):]
+        buffer[:len(data)] = data
+        return len(data)
+
+def read_multipart(stream, boundary, target):
+    """流式解析 multipart/form-data：名为 file 的部分写入 target，返回 (其余字段 {名称: 值}, 文件名)。"""
+    delimiter = b'\r\n--' + boundary.encode('latin-1')
+    buf = b'\r\n'
+    fields = {}
+    filename = None
+
+    def fill():
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('multipart 请求体不完整')
+        return chunk
+
+    while (pos := buf.find(delimiter)) < 0:
+        buf = buf[-len(delimiter):] + fill()
+    buf = buf[pos + len(delimiter):]
+    while True:
+        while len(buf) < 2:
+            buf += fill()
+        if buf.startswith(b'--'):
+            break
+        while (end := buf.find(b'\r\n\r\n')) < 0:
+            if len(buf) > ASYNC_MAX_HEADER:
+                raise ValueError('multipart 头部过长')
+            buf += fill()
+        part_headers = buf[:end].decode('utf-8', 'replace')
+        buf = buf[end + 4:]
+        name = re.search(r'(?<![\w*])name="([^"]*)"', part_headers)
+        name = name.group(1) if name else ''
+        if name == 'file':
+            found = re.search(r'filename="([^"]*)"', part_headers)
+            filename = found.group(1) if found else ''
+            out = target
+        else:
+            out = io.BytesIO()
+        # 分隔符可能跨两次读取，缓冲区末尾保留 len(delimiter) - 1 字节
+        keep = len(delimiter) - 1
+        while (pos := buf.find(delimiter)) < 0:
+            if len(buf) > keep:
+                out.write(buf[:-keep])
+                buf = buf[-keep:]
+            buf += fill()
+        out.write(buf[:pos])
+        buf = buf[pos + len(delimiter):]
+        if out is not target:
+            fields[name] = out.getvalue().decode('utf-8', 'replace')
+    while stream.read(STREAM_CHUNK_SIZE):
+        pass
+    return fields, filename
+
+def open_import_text(stream):
+    """嗅探编码（UTF-8，带或不带 BOM；否则按 GB18030，兼容 Excel 另存的 CSV）和格式，返回 (文本流, 是否 JSON)。"""
+    head = stream.read(STREAM_CHUNK_SIZE)
+    try:
+        head.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # 截断在多字节字符中间不算错误
+        encoding = 'utf-8-sig' if e.start >= len(head) - 3 and e.reason == 'unexpected end of data' else 'gb18030'
+    text = io.TextIOWrapper(io.BufferedReader(_PrefixedReader(head, stream)), encoding=encoding, newline='')
+    is_json = head.lstrip(b'\xef\xbb\xbf \t\r\n')[:1] == b'['
+    return text, is_json
+
+def iter_csv_rows(text):
+    """产出 (行号, 行字典)，行号与表格软件中看到的一致（表头为第 1 行）。"""
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, row
+
+def iter_json_array(text):
+    """增量解析 JSON 数组，逐个产出 (序号, 元素)，不把整个数组读进内存。"""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buf, pos, eof
+        chunk = text.read(STREAM_CHUNK_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def peek():
+        # 跳过空白，返回下一个字符；内容已经读完时返回 ''
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            read_more()
+
+    if peek() != '[':
+        raise ValueError('JSON 数据必须是数组')
+    pos += 1
+    if peek() == ']':
+        return
+    number = 0
+    while True:
+        # 元素可能跨越读取边界：解析失败或恰好解析到缓冲区末尾（如数字）时多读一段再试
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f'JSON 格式错误：第 {number + 1} 个元素无法解析')
+            read_more()
+        number += 1
+        yield number, value
+        pos = end
+        separator = peek()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'JSON 格式错误：第 {number} 个元素之后应为 "," 或 "]"')
+        pos += 1
+        peek()
+
+def parse_import_time(value):
+    """把导入文件里的时间（ISO 8601 或 'YYYY-MM-DD HH:MM:SS'，带时区的换算成本地时间）解析为 datetime。"""
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'时间格式错误: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def normalize_import_record(kind, row):
+    """把导入的一行转换成与表单提交相同结构的记录；字段不合法时抛出 ValueError。"""
+    if not isinstance(row, dict):
+        raise ValueError('记录必须是对象')
+    aliases = IMPORT_FIELD_ALIASES[kind]
+    record = {}
+    for key, value in row.items():
+        if key is None:
+            raise ValueError('列数多于表头')
+        field = aliases.get(key.strip(), key.strip())
+        if isinstance(value, str):
+            value = value.strip()
+            # 去掉导出时为防公式注入加的单引号
+            if value[:1] == "'" and value[1:2] in ('=', '+', '-', '@'):
+                value = value[1:]
+        if value not in ('', None) and field:
+            record.setdefault(field, value)
+
+    name = str(record.get('name', ''))
+    if not NAME_PATTERN.match(name):
+        raise ValueError(f'姓名不合法: {name}' if name else '缺少姓名')
+    phone = re.sub(r'[\s-]', '', str(record.get('phone', '')))
+    if not PHONE_PATTERN.match(phone):
+        raise ValueError(f'电话不合法: {phone}' if phone else '缺少电话')
+    record['name'], record['phone'] = name, phone
+    if 'email' in record:
+        email = str(record['email']).lower()
+        if len(email) > 254 or not EMAIL_PATTERN.match(email):
+            raise ValueError(f'邮箱不合法: {email}')
+        record['email'] = email
+    if 'id' in record:
+        if not str(record['id']).isdigit():
+            raise ValueError(f'ID 不合法: {record["id"]}')
+        record['id'] = int(record['id'])
+
+    submitted = record.get('submitTime') or record.get('timestamp')
+    submitted = parse_import_time(submitted) if submitted else datetime.datetime.now()
+    if kind == 'contacts':
+        labels = {label: code for code, label in CONTACT_TYPE_LABELS.items()}
+        record['type'] = labels.get(record.get('type'), record.get('type', 'contact'))
+        record['submitTime'] = submitted.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        record['submitTime'] = submitted.isoformat()
+    return record
+
+def stats_course(record):
+    return record.get('course', '其他')
+
+def stats_countries(record):
+    country = record.get('target_country', record.get('projects', '其他'))
+    if not country:
+        return ['其他']
+    return split_values(country)
+
+class CategoryCountIndex:
+    """/api/stats 使用的课程分布和国家分布计数。"""
+
+    def __init__(self):
+        self.courses = {}
+        self.countries = {}
+
+    def rebuild(self, records):
+        self.courses = {}
+        self.countries = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record, delta=1):
+        if not counts_in_stats(record):
+            return
+        for counts, keys in ((self.courses, [stats_course(record)]), (self.countries, stats_countries(record))):
+            for key in keys:
+                counts[key] = counts.get(key, 0) + delta
+                if not counts[key]:
+                    del counts[key]
+
+    def remove(self, record):
+        self.add(record, -1)
+
+    def snapshot(self):
+        return {'byCourse': dict(self.courses), 'byCountry': dict(self.countries)}
+
+def normalize_phone(value):
+    # 只保留数字，去掉 +86 / 86 国家码
+    digits = re.sub(r'\D', '', str(value or ''))
+    if len(digits) == 13 and digits.startswith('86'):
+        digits = digits[2:]
+    return digits
+
+def dedupe_keys(record):
+    # 姓名加电话、姓名加邮箱：同一家庭共用电话或邮箱给不同的人报名时不算重复
+    name = re.sub(r'\s+', '', str(record.get('name') or '')).casefold()
+    keys = []
+    phone = normalize_phone(record.get('phone'))
+    if phone:
+        keys.append(f'{name}|phone:{phone}')
+    email = str(record.get('email') or '').strip().lower()
+    if email:
+        keys.append(f'{name}|email:{email}')
+    return keys
+
+def submit_timestamp(record):
+    try:
+        return datetime.datetime.fromisoformat(str(record.get('submitTime'))).timestamp()
+    except ValueError:
+        return None
+
+def merge_record(existing, incoming):
+    """把 incoming 中非空的字段合并进 existing，保留原记录的 id、提交时间和已有的电话、邮箱。"""
+    merged = dict(existing)
+    for key, value in incoming.items():
+        if key in ('id', 'submitTime') or value in ('', None, []):
+            continue
+        if key in ('phone', 'email') and existing.get(key):
+            continue
+        merged[key] = value
+    return merged
+
+class DedupeIndex:
+    """姓名加规范化的电话、邮箱 -> 使用它们的记录，用于判断重复提交。"""
+
+    def __init__(self):
+        self.keys = {}
+
+    def rebuild(self, records):
+        self.keys = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        rid = record_id(record)
+        for key in dedupe_keys(record):
+            self.keys.setdefault(key, {})[rid] = record
+
+    def remove(self, record):
+        rid = record_id(record)
+        for key in dedupe_keys(record):
+            bucket = self.keys.get(key)
+            if bucket is not None:
+                bucket.pop(rid, None)
+                if not bucket:
+                    del self.keys[key]
+
+    def find(self, record, since):
+        """返回 since（时间戳）之后提交、姓名和电话或邮箱都与 record 相同的最近一条记录。"""
+        found = None
+        latest = since
+        for key in dedupe_keys(record):
+            for candidate in self.keys.get(key, {}).values():
+                submitted = submit_timestamp(candidate)
+                if submitted is not None and submitted >= latest:
+                    found, latest = candidate, submitted
+        return found
+
+class IdIndex:
+    """记录 ID -> 记录，按 ID 查找和删除时不用遍历全部记录。"""
+
+    def __init__(self):
+        self.records = {}
+
+    def rebuild(self, records):
+        self.records = {record_id(r): r for r in records}
+
+    def add(self, record):
+        self.records[record_id(record)] = record
+
+    def remove(self, record):
+        rid = record_id(record)
+        if self.records.get(rid) is record:
+            del self.records[rid]
+
+class JsonRecordStore:
+    """常驻内存的记录集合，数据文件仍是原来的 JSON 数组。
+
+    读取直接返回内存中的数据，通过 mtime 和文件大小感知外部修改；
+    新增记录只在文件末尾追加，不再重写整个数组。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0
+        self._records = []
+        self._stamp = None
+        self._bad_stamp = None
+        self._reported_stamp = None
+        self._lock = threading.RLock()
+        # 内存索引：加载时整体重建，增删记录时增量维护
+        self.day_index = DayCountIndex(TREND_GROUP_FIELDS)
+        self.category_index = CategoryCountIndex()
+        self.dedupe_index = DedupeIndex()
+        self.id_index = IdIndex()
+        self._indexes = [self.day_index, self.category_index, self.dedupe_index, self.id_index]
+        # 列表接口的排序结果缓存，数据版本变化后失效
+        self._sorted_cache = {}
+        self._sorted_version = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        try:
+            records = read_json_list(self.path)
+        except ValueError as e:
+            self._parse_failed(stamp, e)
+            return
+        self._load(records)
+        self._stamp = stamp
+
+    def _parse_failed(self, stamp, error):
+        """数据文件无法解析时调用：保留内存中的数据，写入者直接报错，不能用内存中可能过期的数据重写文件。
+
+        没有持有文件锁的读取可能碰上其他进程正在原地追加，先跳过一次；
+        文件没有变化却再次解析失败，或持有文件锁时解析失败（没有其他写入者），说明文件已损坏。
+        """
+        held = self.path in getattr(_file_locks_held, 'paths', ())
+        if held or stamp == self._bad_stamp:
+            if stamp != self._reported_stamp:
+                self._reported_stamp = stamp
+                write_app_log('ERROR', '数据文件无法解析，继续使用内存中的数据', {'file': self.path, 'error': str(error)})
+            if held:
+                raise RuntimeError(f'数据文件无法解析: {self.path}: {error}') from error
+        self._bad_stamp = stamp
+
+    def _load(self, records):
+        self._records = records
+        for index in self._indexes:
+            index.rebuild(records)
+        self.version += 1
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._records)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def data_tag(self):
+        # 以文件状态作为数据版本标识，多进程之间也一致
+        with self._lock:
+            self._refresh()
+            return repr(self._stamp)
+
+    def get(self, rid):
+        with self._lock:
+            self._refresh()
+            return self.id_index.records.get(str(rid))
+
+    def count_by_day(self, group=None):
+        with self._lock:
+            self._refresh()
+            return self.day_index.snapshot(group)
+
+    def category_counts(self):
+        with self._lock:
+            self._refresh()
+            return self.category_index.snapshot()
+
+    def _sorted_view(self, field):
+        with self._lock:
+            self._refresh()
+            if self._sorted_version != self.version:
+                self._sorted_cache = {}
+                self._sorted_version = self.version
+            view = self._sorted_cache.get(field)
+            if view is None:
+                ordered = sorted(self._records, key=lambda r: (sort_value(r, field), record_id(r)))
+                keys = [(sort_value(r, field), record_id(r)) for r in ordered]
+                view = self._sorted_cache[field] = (keys, ordered)
+            return view
+
+    def iter_query(self, spec):
+        """按 spec 的筛选和排序依次产出全部匹配的记录，不分页（导出使用）。"""
+        _, records = self._sorted_view(spec['sort_field'])
+        order = range(len(records) - 1, -1, -1) if spec['desc'] else range(len(records))
+        filtered = spec['from'] or spec['to'] or spec['q']
+        for i in order:
+            if not filtered or match_record(records[i], spec):
+                yield records[i]
+
+    def query(self, spec):
+        """按 spec 筛选、排序、分页，返回 (匹配总数, 当前页记录, 下一页游标键)。"""
+        keys, records = self._sorted_view(spec['sort_field'])
+        n = len(records)
+        if spec['cursor'] is not None:
+            # 游标分页：从上一页最后一条记录的排序键之后继续
+            cursor = tuple(spec['cursor'])
+            if spec['desc']:
+                order = range(bisect.bisect_left(keys, cursor) - 1, -1, -1)
+            else:
+                order = range(bisect.bisect_right(keys, cursor), n)
+        else:
+            order = range(n - 1, -1, -1) if spec['desc'] else range(n)
+        
+        start, limit = spec['offset'], spec['limit']
+        if not (spec['from'] or spec['to'] or spec['q']):
+            total = n
+            positions = order[start:start + limit]
+        else:
+            total = sum(1 for r in records if match_record(r, spec))
+            positions = []
+            skipped = 0
+            for i in order:
+                if not match_record(records[i], spec):
+                    continue
+                if skipped < start:
+                    skipped += 1
+                    continue
+                positions.append(i)
+                if len(positions) == limit:
+                    break
+        page = [records[i] for i in positions]
+        next_key = keys[positions[-1]] if len(positions) == limit else None
+        return total, page, next_key
+
+    def rebuild_indexes(self):
+        with self._lock:
+            self._refresh()
+            for index in self._indexes:
+                index.rebuild(self._records)
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        """追加一批记录，整批只写一次文件。"""
+        if not records:
+            return
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            self._extend_locked(records)
+
+    def append_unique(self, record, window, mode='merge'):
+        """追加一条记录，window 秒内已有重复的记录（见 dedupe_keys）时按 mode 处理。
+
+        返回 (保存的记录, 重复的已有记录或 None)：flag 照常追加并在记录中写入 duplicateOf；
+        reject 不追加，返回已有的记录；merge 把 record 中非空的字段合并进已有的记录。
+        查重和写入在同一把文件锁内完成，多进程同时提交也只会保存一条。
+        """
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            existing = None
+            if window > 0 and mode != 'off':
+                existing = self.dedupe_index.find(record, time.time() - window)
+            if existing is None:
+                self._extend_locked([record])
+                return record, None
+            if mode == 'merge':
+                merged = merge_record(existing, record)
+                if merged != existing:
+                    self._update_locked(existing, merged)
+                return merged, existing
+            if mode == 'reject':
+                return existing, existing
+            record['duplicateOf'] = existing['id']
+            self._extend_locked([record])
+            return record, existing
+
+    def _extend_locked(self, records):
+        self._persist_extend(records)
+        self._records.extend(records)
+        for index in self._indexes:
+            for record in records:
+                index.add(record)
+        self._stamp = self._file_stamp()
+        self.version += 1
+
+    def _update_locked(self, old, new):
+        records = [new if r is old else r for r in self._records]
+        self._persist_update(new, records)
+        self._records = records
+        for index in self._indexes:
+            index.remove(old)
+            index.add(new)
+        self._stamp = self._file_stamp()
+        self.version += 1
+
+    def replace_all(self, records):
+        """用 records 替换全部数据。"""
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            self._persist_replace(records)
+            self._load(list(records))
+            self._stamp = self._file_stamp()
+
+    def existing_ids(self, ids):
+        with self._lock:
+            self._refresh()
+            return {rid for rid in (str(i) for i in ids) if rid in self.id_index.records}
+
+    def existing_dedupe_keys(self, keys):
+        """返回 keys 中已被现有记录使用的查重键（见 dedupe_keys），不限提交时间。"""
+        with self._lock:
+            self._refresh()
+            return {key for key in keys if key in self.dedupe_index.keys}
+
+    def delete_ids(self, ids):
+        ids = {str(i) for i in ids}
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            # 先查 ID 索引，要删除的记录都不存在时不用遍历和重写
+            if ids.isdisjoint(self.id_index.records):
+                return 0
+            remaining = []
+            removed = []
+            for r in self._records:
+                (removed if record_id(r) in ids else remaining).append(r)
+            deleted = len(removed)
+            if deleted:
+                self._persist_delete(ids, remaining)
+                self._records = remaining
+                for index in self._indexes:
+                    for r in removed:
+                        index.remove(r)
+                self._stamp = self._file_stamp()
+                self.version += 1
+            return deleted
+
+    def _persist_delete(self, ids, remaining):
+        write_json_atomic(self.path, remaining)
+
+    def _persist_replace(self, records):
+        write_json_atomic(self.path, records)
+
+    def _persist_update(self, record, records):
+        write_json_atomic(self.path, records)
+
+    @timed_storage('append')
+    def _persist_extend(self, records):
+        # 定位数组末尾的 ']'，在其前面写入新元素，格式与 json.dump(indent=2) 一致
+        entries = ',\n  '.join(json.dumps(r, ensure_ascii=False, indent=2).replace('\n', '\n  ') for r in records)
+        try:
+            with open(self.path, 'r+b') as f:
+                pos = f.seek(0, os.SEEK_END)
+                tail = b''
+                # 向前读取，直到拿到 ']' 以及它前面的一个非空白字符
+                while pos > 0 and len(tail.strip()) < 2:
+                    step = min(pos, 256)
+                    pos -= step
+                    f.seek(pos)
+                    tail = f.read(step) + tail
+                body = tail.rstrip()
+                head = body[:-1].rstrip()
+                if not body.endswith(b']') or not head:
+                    raise ValueError('数据文件格式异常')
+                f.seek(pos + len(head))
+                empty = head.endswith(b'[')
+                prefix = '\n  ' if empty else ',\n  '
+                f.write((prefix + entries + '\n]').encode('utf-8'))
+                f.truncate()
+        except (FileNotFoundError, ValueError):
+            # 文件不存在或结尾不是数组：重新读取文件（调用方持有文件锁）后整体重写，
+            # 不用内存中的数据覆盖，文件无法解析时 read_json_list 直接抛出
+            write_json_atomic(self.path, read_json_list(self.path) + list(records))
+
+def journal_path_for(path):
+    return os.path.splitext(path)[0] + '.journal.jsonl'
+
+def replay_journal(journal_path, offset, records, snapshot_index=None):
+    """从 offset 开始把日志重放到 records 上，返回新的偏移量和重放条数。"""
+    try:
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return offset, 0
+    # 只处理完整的行，写了一半的最后一行留到下次
+    end = data.rfind(b'\n') + 1
+    applied = 0
+    for line in data[:end].splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('op') == 'add':
+            record = entry['record']
+            if snapshot_index is not None and snapshot_index.get(record_id(record)) == record:
+                continue
+            records.append(record)
+        elif entry.get('op') == 'delete':
+            ids = set(entry['ids'])
+            records[:] = [r for r in records if record_id(r) not in ids]
+        elif entry.get('op') == 'update':
+            record = entry['record']
+            rid = record_id(record)
+            records[:] = [record if record_id(r) == rid else r for r in records]
+        applied += 1
+    return offset + end, applied
+
+class JournalRecordStore(JsonRecordStore):
+    """追加写日志模式：每次提交只向 JSON-lines 日志追加一行。
+
+    原 JSON 文件作为快照，后台线程定期把日志合并进快照并清空日志；
+    启动时由快照加日志重放恢复数据。重放时跳过与快照中完全相同的记录，
+    因此合并过程中崩溃也不会产生重复数据。
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.journal_path = journal_path_for(path)
+        self._journal = None
+        self._journal_offset = 0
+        self._pending = 0
+        self._dirty = False
+        self._owner_pid = None
+        self._wakeup = threading.Event()
+
+    def _file_stamp(self):
+        stamps = []
+        for path in (self.path, self.journal_path):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _refresh(self):
+        self._ensure_worker()
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        journal_size = stamp[1][1] if stamp[1] else 0
+        if self._stamp is not None and stamp[0] == self._stamp[0] and journal_size >= self._journal_offset:
+            # 快照未变，只重放其他进程新追加的日志
+            self._replay(self._records, None)
+            self._load(self._records)
+        else:
+            try:
+                records = read_json_list(self.path)
+            except ValueError as e:
+                self._parse_failed(stamp, e)
+                return
+            self._journal_offset = 0
+            self._pending = 0
+            self._replay(records, {record_id(r): r for r in records})
+            self._load(records)
+        self._stamp = stamp
+
+    def _replay(self, records, snapshot_index):
+        self._journal_offset, applied = replay_journal(
+            self.journal_path, self._journal_offset, records, snapshot_index)
+        self._pending += applied
+
+    @timed_storage('journal_write')
+    def _write_entries(self, entries):
+        # 一批日志行合并成一次写入
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        lines = ''.join(json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n' for e in entries)
+        self._journal.write(lines.encode('utf-8'))
+        self._journal.flush()
+        if JOURNAL_FSYNC == 'always':
+            os.fsync(self._journal.fileno())
+        else:
+            self._dirty = True
+        self._journal_offset = self._journal.tell()
+        self._pending += len(entries)
+        if self._pending >= JOURNAL_COMPACT_THRESHOLD:
+            self._wakeup.set()
+
+    def _persist_extend(self, records):
+        self._write_entries([{'op': 'add', 'record': r} for r in records])
+
+    def _persist_delete(self, ids, remaining):
+        self._write_entries([{'op': 'delete', 'ids': sorted(ids)}])
+
+    def _persist_update(self, record, records):
+        self._write_entries([{'op': 'update', 'record': record}])
+
+    def _persist_replace(self, records):
+        # 直接写成新快照并清空日志，与合并时相同
+        write_json_atomic(self.path, records)
+        with open(self.journal_path, 'ab') as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+        self._journal_offset = 0
+        self._pending = 0
+
+    @timed_storage('compact')
+    def compact(self):
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            if not self._pending:
+                return
+            write_json_atomic(self.path, self._records)
+            # 原地截断而不是替换文件，其他进程持有的追加句柄仍然有效
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(0)
+                os.fsync(f.fileno())
+            self._journal_offset = 0
+            self._pending = 0
+            self._stamp = self._file_stamp()
+
+    def _sync(self):
+        with self._lock:
+            if self._dirty and self._journal is not None:
+                if JOURNAL_FSYNC == 'interval':
+                    os.fsync(self._journal.fileno())
+                self._dirty = False
+
+    def _ensure_worker(self):
+        # fork 之后线程和文件句柄都不会继承，按进程懒启动后台线程
+        if self._owner_pid == os.getpid():
+            return
+        self._owner_pid = os.getpid()
+        self._journal = None
+        threading.Thread(target=self._background_loop, name='journal-compactor', daemon=True).start()
+
+    def _background_loop(self):
+        last_compact = time.monotonic()
+        while True:
+            self._wakeup.wait(JOURNAL_FSYNC_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self._sync()
+                due = time.monotonic() - last_compact >= JOURNAL_COMPACT_INTERVAL
+                if self._pending and (due or self._pending >= JOURNAL_COMPACT_THRESHOLD):
+                    self.compact()
+                    last_compact = time.monotonic()
+            except Exception as e:
+                write_app_log('ERROR', '合并日志文件时出错', {'file': self.journal_path, 'error': str(e)})
+
+class SqliteRecordStore:
+    """SQLite 存储后端（WAL 模式），与 JsonRecordStore 提供相同的接口。
+
+    每条记录完整存为 JSON 文本，另外抽出 id、submitTime、phone 三列建索引，
+    按 id 查找和删除、按日期统计都走索引，不需要反序列化全部记录。
+    """
+
+    def __init__(self, path, db_path=SQLITE_FILE):
+        self.path = path
+        self.db_path = db_path
+        self.table = os.path.splitext(os.path.basename(path))[0]
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        # 每个线程（以及 fork 后的每个进程）使用独立连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_schema(conn)
+                    self._initialized = True
+        return conn
+
+    def _create_schema(self, conn):
+        t = self.table
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS store_meta ('
+                         'name TEXT PRIMARY KEY, version INTEGER NOT NULL, migrated INTEGER NOT NULL)')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {t} ('
+                         'seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, '
+                         'submit_time TEXT, phone TEXT, data TEXT NOT NULL)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{t}_id ON {t}(id)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{t}_submit_time ON {t}(submit_time, id)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{t}_phone ON {t}(phone)')
+            # 任何增删改都会递增版本号，多进程下也能据此判断数据是否变化
+            for event in ('INSERT', 'DELETE', 'UPDATE'):
+                conn.execute(f'CREATE TRIGGER IF NOT EXISTS trg_{t}_{event.lower()} AFTER {event} ON {t} '
+                             f"BEGIN UPDATE store_meta SET version = version + 1 WHERE name = '{t}'; END")
+            self._create_category_counts(conn)
+            self._create_day_counts(conn)
+            self._create_dedupe_keys(conn)
+            conn.execute('INSERT OR IGNORE INTO store_meta (name, version, migrated) VALUES (?, 0, 0)', (t,))
+            migrated = conn.execute('SELECT migrated FROM store_meta WHERE name = ?', (t,)).fetchone()[0]
+            if not migrated:
+                migrate_json_to_sqlite(self, conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _category_keys(data):
+        # /api/stats 的分组键，与 stats_course / stats_countries 对应；国家的逗号分隔和数组在读取时再拆开
+        course = f"COALESCE(json_extract({data}, '$.course'), '其他')"
+        country = (f"COALESCE(CASE WHEN json_type({data}, '$.target_country') IS NOT NULL "
+                   f"THEN json_extract({data}, '$.target_country') "
+                   f"ELSE json_extract({data}, '$.projects') END, '其他')")
+        return (('course', course), ('country', country))
+
+    @staticmethod
+    def _counted(data):
+        # 与 counts_in_stats 对应：带 duplicateOf 的重复提交不计入统计
+        return f"json_extract({data}, '$.duplicateOf') IS NULL"
+
+    @staticmethod
+    def _install_triggers(conn, triggers):
+        """按名称创建触发器，已有的定义不同时替换；返回是否有触发器被新建或替换。"""
+        changed = False
+        for name, sql in triggers.items():
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                               (name,)).fetchone()
+            if row is not None and row[0] == sql:
+                continue
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+            conn.execute(sql)
+            changed = True
+        return changed
+
+    def _create_category_counts(self, conn):
+        """课程、国家分布的计数表，由触发器在增删改记录的同一个事务内维护，/api/stats 不用扫描全表。"""
+        t = self.table
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {t}_category_counts ('
+                     'kind TEXT NOT NULL, key TEXT NOT NULL, n INTEGER NOT NULL, PRIMARY KEY (kind, key))')
+        add = ''.join(f"INSERT INTO {t}_category_counts (kind, key, n) VALUES ('{kind}', {expr}, 1) "
+                      f'ON CONFLICT (kind, key) DO UPDATE SET n = n + 1; '
+                      for kind, expr in self._category_keys('NEW.data'))
+        remove = ''.join(f"UPDATE {t}_category_counts SET n = n - 1 WHERE kind = '{kind}' AND key = {expr}; "
+                         for kind, expr in self._category_keys('OLD.data'))
+        remove += f'DELETE FROM {t}_category_counts WHERE n <= 0; '
+        # 修改记录拆成两个触发器：旧记录计入统计时减去，新记录计入统计时加上
+        changed = self._install_triggers(conn, {
+            f'trg_{t}_counts_insert': f'CREATE TRIGGER trg_{t}_counts_insert AFTER INSERT ON {t} '
+                                      f"WHEN {self._counted('NEW.data')} BEGIN {add}END",
+            f'trg_{t}_counts_delete': f'CREATE TRIGGER trg_{t}_counts_delete AFTER DELETE ON {t} '
+                                      f"WHEN {self._counted('OLD.data')} BEGIN {remove}END",
+            f'trg_{t}_counts_update_old': f'CREATE TRIGGER trg_{t}_counts_update_old AFTER UPDATE OF data ON {t} '
+                                          f"WHEN {self._counted('OLD.data')} BEGIN {remove}END",
+            f'trg_{t}_counts_update_new': f'CREATE TRIGGER trg_{t}_counts_update_new AFTER UPDATE OF data ON {t} '
+                                          f"WHEN {self._counted('NEW.data')} BEGIN {add}END",
+        })
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_{t}_counts_update')
+        if changed:
+            # 新建的计数表或触发器定义有变化（升级前创建的数据库）：按现有记录重新计数
+            self._recount_categories(conn)
+
+    def _recount_categories(self, conn):
+        t = self.table
+        conn.execute(f'DELETE FROM {t}_category_counts')
+        for kind, expr in self._category_keys('data'):
+            conn.execute(f'INSERT INTO {t}_category_counts (kind, key, n) '
+                         f"SELECT '{kind}', {expr} AS key, COUNT(*) FROM {t} "
+                         f"WHERE {self._counted('data')} GROUP BY key")
+
+    _VALID_DAY = "GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+
+    @staticmethod
+    def _day_keys(row):
+        # (field, value) 对：field 为空的一行是当天总数，其余按 TREND_GROUP_FIELDS 分组，多选值在读取时再拆开
+        keys = [("''", "''")]
+        keys += [(f"'{field}'", f"COALESCE(json_extract({row}.data, '$.{field}'), '')") for field in TREND_GROUP_FIELDS]
+        return keys
+
+    def _create_day_counts(self, conn):
+        """/api/stats 和 /api/trends 使用的按日计数表，与分类计数表一样由触发器在写入的同一个事务内维护。"""
+        t = self.table
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {t}_day_counts ('
+                     'day TEXT NOT NULL, field TEXT NOT NULL, value NOT NULL, n INTEGER NOT NULL, '
+                     'PRIMARY KEY (field, day, value))')
+        add = ''.join(f'INSERT INTO {t}_day_counts (day, field, value, n) '
+                      f'VALUES (substr(NEW.submit_time, 1, 10), {field}, {value}, 1) '
+                      f'ON CONFLICT (field, day, value) DO UPDATE SET n = n + 1; '
+                      for field, value in self._day_keys('NEW'))
+        remove = ''.join(f'UPDATE {t}_day_counts SET n = n - 1 WHERE field = {field} '
+                         f'AND day = substr(OLD.submit_time, 1, 10) AND value = {value}; '
+                         f'DELETE FROM {t}_day_counts WHERE field = {field} '
+                         f'AND day = substr(OLD.submit_time, 1, 10) AND value = {value} AND n <= 0; '
+                         for field, value in self._day_keys('OLD'))
+        counted = {row: f"{row}.submit_time {self._VALID_DAY} AND {self._counted(f'{row}.data')}"
+                   for row in ('NEW', 'OLD')}
+        changed = self._install_triggers(conn, {
+            f'trg_{t}_days_insert': f'CREATE TRIGGER trg_{t}_days_insert AFTER INSERT ON {t} '
+                                    f"WHEN {counted['NEW']} BEGIN {add}END",
+            f'trg_{t}_days_delete': f'CREATE TRIGGER trg_{t}_days_delete AFTER DELETE ON {t} '
+                                    f"WHEN {counted['OLD']} BEGIN {remove}END",
+            f'trg_{t}_days_update_old': f'CREATE TRIGGER trg_{t}_days_update_old AFTER UPDATE OF submit_time, data '
+                                        f"ON {t} WHEN {counted['OLD']} BEGIN {remove}END",
+            f'trg_{t}_days_update_new': f'CREATE TRIGGER trg_{t}_days_update_new AFTER UPDATE OF submit_time, data '
+                                        f"ON {t} WHEN {counted['NEW']} BEGIN {add}END",
+        })
+        if changed:
+            self._recount_days(conn)
+
+    def _recount_days(self, conn):
+        # 完整重算：只在建表、触发器定义变化和 /api/stats?verify=1 发现不一致时执行
+        t = self.table
+        conn.execute(f'DELETE FROM {t}_day_counts')
+        for field, value in self._day_keys(t):
+            conn.execute(f'INSERT INTO {t}_day_counts (day, field, value, n) '
+                         f'SELECT substr(submit_time, 1, 10) AS day, {field}, {value} AS value, COUNT(*) FROM {t} '
+                         f"WHERE submit_time {self._VALID_DAY} AND {self._counted('data')} GROUP BY day, value")
+
+    def _create_dedupe_keys(self, conn):
+        """查重键表：每条记录的 dedupe_keys 各占一行，查重时按键直接查索引，不用读取和解析记录。
+
+        电话的规范化不方便用 SQL 表达，写入记录时由 _insert_rows 一并写入；删除记录时由触发器删除。
+        """
+        t = self.table
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (f'{t}_dedupe_keys',)).fetchone()
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {t}_dedupe_keys ('
+                     'key TEXT NOT NULL, id TEXT NOT NULL, submitted REAL, PRIMARY KEY (key, id)) WITHOUT ROWID')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{t}_dedupe_keys_id ON {t}_dedupe_keys(id)')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS trg_{t}_dedupe_delete AFTER DELETE ON {t} '
+                     f'BEGIN DELETE FROM {t}_dedupe_keys WHERE id = OLD.id; END')
+        if not exists:
+            # 升级前创建的数据库：按现有记录补齐查重键
+            records = (json.loads(data) for (data,) in conn.execute(f'SELECT data FROM {t}'))
+            conn.executemany(f'INSERT OR IGNORE INTO {t}_dedupe_keys (key, id, submitted) VALUES (?, ?, ?)',
+                             list(self._dedupe_rows(records)))
+
+    @staticmethod
+    def _dedupe_rows(records):
+        for record in records:
+            rid, submitted = record_id(record), submit_timestamp(record)
+            for key in dedupe_keys(record):
+                yield key, rid, submitted
+
+    def _insert_rows(self, conn, records):
+        """在调用方的事务内插入记录和它们的查重键。"""
+        records = list(records)
+        conn.executemany(f'INSERT INTO {self.table} (id, submit_time, phone, data) VALUES (?, ?, ?, ?)',
+                         [self._row(r) for r in records])
+        conn.executemany(f'INSERT OR IGNORE INTO {self.table}_dedupe_keys (key, id, submitted) VALUES (?, ?, ?)',
+                         list(self._dedupe_rows(records)))
+
+    # 排序字段对应的列或表达式；submit_time 和 phone 有索引
+    _SORT_COLUMNS = {
+        'submitTime': 'submit_time',
+        'phone': 'phone',
+        'name': "COALESCE(json_extract(data, '$.name'), '')",
+        'email': "COALESCE(json_extract(data, '$.email'), '')",
+    }
+
+    @staticmethod
+    def _row(record):
+        # 索引列与 JSON 存储的排序键保持一致：缺失的字段存为空字符串
+        return (record_id(record), sort_value(record, 'submitTime'), sort_value(record, 'phone'),
+                json.dumps(record, ensure_ascii=False))
+
+    @property
+    def version(self):
+        row = self._conn().execute('SELECT version FROM store_meta WHERE name = ?', (self.table,)).fetchone()
+        return row[0] if row else 0
+
+    def data_tag(self):
+        return str(self.version)
+
+    @timed_storage('read')
+    def all(self):
+        rows = self._conn().execute(f'SELECT data FROM {self.table} ORDER BY seq')
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self):
+        return self._conn().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def get(self, rid):
+        row = self._conn().execute(f'SELECT data FROM {self.table} WHERE id = ? LIMIT 1', (str(rid),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count_by_day(self, group=None):
+        # 读取触发器维护的按日计数表，行数只与天数（和分组取值的个数）有关
+        if group is None:
+            return dict(self._conn().execute(f"SELECT day, n FROM {self.table}_day_counts WHERE field = ''"))
+        if group not in TREND_GROUP_FIELDS:
+            return {}
+        rows = self._conn().execute(f'SELECT day, value, n FROM {self.table}_day_counts WHERE field = ?', (group,))
+        counts = {}
+        for day, value, n in rows:
+            buckets = counts.setdefault(day, {})
+            if isinstance(value, str) and value.startswith('['):
+                value = json.loads(value)
+            for v in split_values(value or '其他'):
+                buckets[v] = buckets.get(v, 0) + n
+        return counts
+
+    def _filter_clause(self, spec):
+        where, args = [], []
+        if spec['from'] or spec['to']:
+            where.append("submit_time GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'")
+            if spec['from']:
+                where.append('submit_time >= ?')
+                args.append(spec['from'])
+            if spec['to']:
+                where.append('submit_time < ?')
+                args.append((datetime.date.fromisoformat(spec['to']) + datetime.timedelta(days=1)).isoformat())
+        if spec['q']:
+            pattern = '%' + spec['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            columns = ['phone'] + [self._SORT_COLUMNS[f] for f in LIST_SEARCH_FIELDS if f != 'phone']
+            where.append('(' + ' OR '.join(f"lower({c}) LIKE ? ESCAPE '\\'" for c in columns) + ')')
+            args.extend([pattern] * len(columns))
+        return ' AND '.join(where) or '1', args
+
+    def iter_query(self, spec):
+        """按 spec 的筛选和排序依次产出全部匹配的记录，不分页；逐行读取游标，内存占用与记录数无关。"""
+        condition, args = self._filter_clause(spec)
+        column = self._SORT_COLUMNS[spec['sort_field']]
+        direction = 'DESC' if spec['desc'] else 'ASC'
+        rows = self._conn().execute(
+            f'SELECT data FROM {self.table} WHERE {condition} ORDER BY {column} {direction}, id {direction}', args)
+        for (data,) in rows:
+            yield json.loads(data)
+
+    @timed_storage('query')
+    def query(self, spec):
+        condition, args = self._filter_clause(spec)
+        conn = self._conn()
+        total = conn.execute(f'SELECT COUNT(*) FROM {self.table} WHERE {condition}', args).fetchone()[0]
+        
+        column = self._SORT_COLUMNS[spec['sort_field']]
+        direction = 'DESC' if spec['desc'] else 'ASC'
+        if spec['cursor'] is not None:
+            # 游标分页：行值比较可以直接利用 (submit_time, id) 索引
+            condition += f" AND ({column}, id) {'<' if spec['desc'] else '>'} (?, ?)"
+            args = args + list(spec['cursor'])
+        rows = conn.execute(
+            f'SELECT {column}, id, data FROM {self.table} WHERE {condition} '
+            f'ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?',
+            args + [spec['limit'], spec['offset']]).fetchall()
+        page = [json.loads(data) for _, _, data in rows]
+        next_key = (rows[-1][0], rows[-1][1]) if len(rows) == spec['limit'] else None
+        return total, page, next_key
+
+    def category_counts(self):
+        courses = {}
+        countries = {}
+        for kind, key, n in self._conn().execute(f'SELECT kind, key, n FROM {self.table}_category_counts'):
+            if kind == 'course':
+                courses[key] = courses.get(key, 0) + n
+                continue
+            if key.startswith('['):
+                key = json.loads(key)
+            for country in stats_countries({'target_country': key}):
+                countries[country] = countries.get(country, 0) + n
+        return {'byCourse': courses, 'byCountry': countries}
+
+    def rebuild_indexes(self):
+        # 没有内存索引，按现有记录重新计算触发器维护的计数表
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._recount_categories(conn)
+            self._recount_days(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @timed_storage('insert')
+    def append(self, record):
+        self._write_batch([record], replace=False)
+
+    @timed_storage('insert')
+    def append_unique(self, record, window, mode='merge'):
+        """与 JsonRecordStore.append_unique 相同，查重和写入在同一个写事务内完成。"""
+        if window <= 0 or mode == 'off':
+            self.append(record)
+            return record, None
+        keys = dedupe_keys(record)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 按查重键表的主键查找窗口内最近提交的记录（提交时间相同时取后写入的），只读取这一条
+            existing = None
+            if keys:
+                row = conn.execute(
+                    f'SELECT r.data FROM {self.table}_dedupe_keys k JOIN {self.table} r ON r.id = k.id '
+                    f"WHERE k.key IN ({','.join('?' * len(keys))}) AND k.submitted >= ? "
+                    'ORDER BY k.submitted DESC, r.seq DESC LIMIT 1', keys + [time.time() - window]).fetchone()
+                existing = json.loads(row[0]) if row else None
+            stored = record
+            if existing is not None and mode == 'merge':
+                stored = merge_record(existing, record)
+                if stored != existing:
+                    rid, submit_time, phone, data = self._row(stored)
+                    conn.execute(f'UPDATE {self.table} SET submit_time = ?, phone = ?, data = ? WHERE id = ?',
+                                 (submit_time, phone, data, rid))
+                    conn.execute(f'DELETE FROM {self.table}_dedupe_keys WHERE id = ?', (rid,))
+                    conn.executemany(f'INSERT OR IGNORE INTO {self.table}_dedupe_keys (key, id, submitted) '
+                                     'VALUES (?, ?, ?)', list(self._dedupe_rows([stored])))
+            elif existing is not None and mode == 'reject':
+                stored = existing
+            else:
+                if existing is not None:
+                    record['duplicateOf'] = existing['id']
+                self._insert_rows(conn, [record])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return stored, existing
+
+    @timed_storage('insert')
+    def extend(self, records):
+        """一个事务内插入一批记录。"""
+        self._write_batch(records, replace=False)
+
+    @timed_storage('replace')
+    def replace_all(self, records):
+        self._write_batch(records, replace=True)
+
+    def _write_batch(self, records, replace):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if replace:
+                conn.execute(f'DELETE FROM {self.table}')
+            self._insert_rows(conn, records)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _select_in(self, columns, column, values, table=None):
+        # 分批拼 IN 子句，避免超出 SQLite 的参数个数上限
+        values = list(values)
+        table = table or self.table
+        conn = self._conn()
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            yield from conn.execute(f'SELECT {columns} FROM {table} WHERE {column} IN ({marks})', chunk)
+
+    def existing_ids(self, ids):
+        return {rid for (rid,) in self._select_in('id', 'id', {str(i) for i in ids})}
+
+    def existing_dedupe_keys(self, keys):
+        # 查重键表以 key 开头的主键即可按键查找
+        return {key for (key,) in self._select_in('DISTINCT key', 'key', set(keys), f'{self.table}_dedupe_keys')}
+
+    @timed_storage('delete')
+    def delete_ids(self, ids):
+        ids = list({str(i) for i in ids})
+        conn = self._conn()
+        deleted = 0
+        with conn:
+            # 分批拼 IN 子句，避免超出 SQLite 的参数个数上限
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                deleted += conn.execute(f'DELETE FROM {self.table} WHERE id IN ({marks})', chunk).rowcount
+        return deleted
+
+def migrate_json_to_sqlite(store, conn):
+    """把 JSON 文件（含尚未合并的日志）中的记录一次性导入 SQLite。
+
+    由 SqliteRecordStore 在建表事务内调用，store_meta.migrated 保证只执行一次。
+    """
+    records = read_json_list(store.path)
+    replay_journal(journal_path_for(store.path), 0, records, {record_id(r): r for r in records})
+    store._insert_rows(conn, records)
+    conn.execute('UPDATE store_meta SET migrated = 1 WHERE name = ?', (store.table,))
+    write_app_log('INFO', '已将 JSON 数据迁移到 SQLite',
+                  {'file': store.path, 'database': store.db_path, 'table': store.table, 'records': len(records)})
+    return len(records)
+
+TREND_GRANULARITIES = ('day', 'week', 'month')
+
+def bucket_start(date, granularity):
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+def compute_trends(day_counts, today, days, granularity='day', group_counts=None):
+    """把最近 days 天的按日计数汇总成趋势数据，最早的日期在前。"""
+    buckets = {}
+    order = []
+    start = today - datetime.timedelta(days=days - 1)
+    for i in range(days):
+        date = start + datetime.timedelta(days=i)
+        key = bucket_start(date, granularity)
+        bucket = buckets.get(key)
+        if bucket is None:
+            label = date.strftime('%Y-%m') if granularity == 'month' else key.strftime('%m/%d')
+            bucket = buckets[key] = {'date': key.strftime('%Y-%m-%d'), 'label': label, 'count': 0}
+            if group_counts is not None:
+                bucket['groups'] = {}
+            order.append(key)
+        day = date.isoformat()
+        bucket['count'] += day_counts.get(day, 0)
+        if group_counts is not None:
+            for value, n in group_counts.get(day, {}).items():
+                bucket['groups'][value] = bucket['groups'].get(value, 0) + n
+    return [buckets[key] for key in order]
+
+def build_stats(reg_total, reg_days, categories, contact_total, contact_days, today):
+    week_start = today - datetime.timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    return {
+        'total': reg_total,
+        'today': reg_days.get(today.isoformat(), 0),
+        'thisWeek': count_since(reg_days, week_start),
+        'thisMonth': count_since(reg_days, month_start),
+        'byCourse': categories['byCourse'],
+        'byCountry': categories['byCountry'],
+        'contacts': {
+            'total': contact_total,
+            'today': contact_days.get(today.isoformat(), 0),
+            'thisWeek': count_since(contact_days, week_start),
+            'thisMonth': count_since(contact_days, month_start)
+        }
+    }
+
+def compute_stats_full(registrations, contacts, today):
+    """不依赖增量索引，从原始记录完整重算一遍统计数据，用于一致性校验。"""
+    registrations = [r for r in registrations if counts_in_stats(r)]
+    contacts = [r for r in contacts if counts_in_stats(r)]
+    reg_days = DayCountIndex()
+    reg_days.rebuild(registrations)
+    contact_days = DayCountIndex()
+    contact_days.rebuild(contacts)
+    categories = CategoryCountIndex()
+    categories.rebuild(registrations)
+    return build_stats(len(registrations), reg_days.snapshot(), categories.snapshot(),
+                       len(contacts), contact_days.snapshot(), today)
+
+def choose_encoding(accept_encoding, available=None):
+    """根据 Accept-Encoding 选择压缩方式，优先 br，其次 gzip，都不接受时返回 None。"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token.strip().lower()] = q
+    if available is None:
+        available = (('br',) if brotli else ()) + ('gzip',)
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+    # mtime 固定为 0，保证相同内容压缩结果一致
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+_ASSET_REF_PATTERNS = (
+    re.compile(r'''(\b(?:href|src)\s*=\s*["'])([^"']+)(["'])''', re.IGNORECASE),
+    re.compile(r'''(url\(\s*["']?)([^"')]+)(["']?\s*\))''', re.IGNORECASE),
+)
+
+def rewrite_asset_refs(text, base_url, manifest):
+    """把文本中引用的本地资源地址替换为带哈希的地址。"""
+    def replace(match):
+        ref = match.group(2).strip()
+        if re.match(r'^(?:[a-z][a-z0-9+.-]*:|//|#)', ref, re.IGNORECASE):
+            return match.group(0)
+        path = urllib.parse.unquote(ref.split('#', 1)[0].split('?', 1)[0])
+        if not path:
+            return match.group(0)
+        if not path.startswith('/'):
+            path = posixpath.join(posixpath.dirname(base_url), path)
+        entry = manifest.get(posixpath.normpath(path))
+        if not entry or not entry.get('url'):
+            return match.group(0)
+        return match.group(1) + urllib.parse.quote(entry['url']) + match.group(3)
+
+    for pattern in _ASSET_REF_PATTERNS:
+        text = pattern.sub(replace, text)
+    return text
+
+def build_static_assets(root='.', build_dir=STATIC_BUILD_DIR):
+    """构建静态资源：计算内容哈希、改写页面中的引用，并预先生成 .gz/.br 文件。
+
+    图片等二进制文件只记录哈希，文件内容未变时沿用上次的结果；
+    CSS 中的 url() 和 HTML 中的 href/src 会改写成带哈希的地址，
+    因此按 二进制文件 -> CSS/JS -> HTML 的顺序处理。
+    """
+    manifest_path = os.path.join(build_dir, 'manifest.json')
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and
+                       not (rel_dir == '.' and d in STATIC_SKIP_DIRS)]
+        for filename in filenames:
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in STATIC_TEXT_EXTS or ext in STATIC_BINARY_EXTS:
+                rel = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, '/')
+                sources.append(rel)
+
+    def stage(rel):
+        ext = os.path.splitext(rel)[1].lower()
+        if ext in STATIC_BINARY_EXTS:
+            return 0
+        return 2 if ext in ('.html', '.htm') else 1
+
+    manifest = {}
+    for rel in sorted(sources, key=stage):
+        url = '/' + rel
+        source = os.path.join(root, rel)
+        st = os.stat(source)
+        entry = {'source': rel, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+        old = previous.get(url)
+
+        if stage(rel) == 0:
+            if old and old.get('mtime_ns') == st.st_mtime_ns and old.get('size') == st.st_size:
+                entry['hash'] = old['hash']
+            else:
+                with open(source, 'rb') as f:
+                    entry['hash'] = hashlib.sha256(f.read()).hexdigest()[:10]
+            entry['built'] = None
+            entry['encodings'] = []
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+            if rel.endswith(('.html', '.htm', '.css')):
+                text = data.decode('utf-8', errors='surrogateescape')
+                data = rewrite_asset_refs(text, url, manifest).encode('utf-8', errors='surrogateescape')
+            entry['hash'] = hashlib.sha256(data).hexdigest()[:10]
+            target = os.path.join(build_dir, rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            entry['built'] = rel
+            entry['encodings'] = []
+            if len(data) >= COMPRESS_MIN_SIZE:
+                for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+                    if encoding == 'br' and brotli is None:
+                        continue
+                    with open(target + suffix, 'wb') as f:
+                        f.write(gzip.compress(data, compresslevel=9, mtime=0) if encoding == 'gzip'
+                                else brotli.compress(data, quality=11))
+                    entry['encodings'].append(encoding)
+
+        # HTML 是入口页面，保持原地址；其他资源使用带哈希的文件名
+        if stage(rel) == 2:
+            entry['url'] = None
+        else:
+            stem, ext = posixpath.splitext(url)
+            entry['url'] = f'{stem}.{entry["hash"]}{ext}'
+        manifest[url] = entry
+
+    os.makedirs(build_dir, exist_ok=True)
+    write_json_atomic(manifest_path, manifest)
+    return manifest
+
+def load_static_manifest(build_dir=STATIC_BUILD_DIR):
+    try:
+        with open(os.path.join(build_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    set_static_manifest(manifest)
+    return manifest
+
+STATIC_MANIFEST = {}
+STATIC_HASHED_URLS = {}
+
+def set_static_manifest(manifest):
+    global STATIC_MANIFEST, STATIC_HASHED_URLS
+    STATIC_MANIFEST = manifest
+    STATIC_HASHED_URLS = {e['url']: url for url, e in manifest.items() if e.get('url')}
+
+def resolve_static_asset(url_path):
+    """查找请求地址对应的构建产物，源文件在构建后被修改过时返回 None。"""
+    immutable = False
+    key = url_path + 'index.html' if url_path.endswith('/') else url_path
+    if key in STATIC_HASHED_URLS:
+        key = STATIC_HASHED_URLS[key]
+        immutable = True
+    entry = STATIC_MANIFEST.get(key)
+    if not entry:
+        return None
+    if immutable and entry['built']:
+        # 构建目录里的副本就是该哈希对应的内容，源文件改动不影响旧地址
+        return entry, immutable
+    try:
+        st = os.stat(entry['source'])
+    except OSError:
+        return None
+    if st.st_mtime_ns != entry['mtime_ns'] or st.st_size != entry['size']:
+        return None
+    return entry, immutable
+
+IMAGE_WEBP = Image is not None and image_features.check('webp')
+_IMAGE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+_image_sizes = {}
+# 缩放大图很占内存，同一时间只生成一张
+_image_build_lock = threading.Lock()
+
+def _reset_image_build_lock():
+    global _image_build_lock
+    _image_build_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_image_build_lock)
+
+def accepts_image_type(accept, mime):
+    for item in (accept or '').split(','):
+        params = [p.strip() for p in item.split(';')]
+        if params[0].lower() != mime:
+            continue
+        for p in params[1:]:
+            if p.startswith('q='):
+                try:
+                    return float(p[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+def choose_image_width(requested=None):
+    # 取不小于请求宽度的最小档位；未指定宽度时使用最大档位
+    if requested is not None:
+        for width in IMAGE_WIDTHS:
+            if width >= requested:
+                return width
+    return IMAGE_WIDTHS[-1]
+
+def image_size(source):
+    if Image is None:
+        return None
+    mtime_ns = os.stat(source).st_mtime_ns
+    cached = _image_sizes.get(source)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    with Image.open(source) as img:
+        size = img.size
+    _image_sizes[source] = (mtime_ns, size)
+    return size
+
+def image_derivative_path(source, width, fmt):
+    name = os.path.relpath(source) + (f'.{width}w' if width else '') + fmt
+    return os.path.join(IMAGE_CACHE_DIR, name)
+
+def generate_image_derivative(source, target, width, fmt):
+    with Image.open(source) as img:
+        if width:
+            # JPEG 可以在解码时直接按比例缩小，大图省去大部分解码开销
+            img.draft('RGB', (width, width))
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+
+        options = {}
+        if fmt in ('.jpg', '.jpeg'):
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            options = {'quality': IMAGE_QUALITY, 'optimize': True, 'progressive': True}
+        elif fmt == '.webp':
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.mode or 'transparency' in img.info else 'RGB')
+            options = {'quality': IMAGE_QUALITY, 'method': 4}
+        else:
+            options = {'optimize': True}
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, _IMAGE_FORMATS[fmt], **options)
+            os.replace(tmp_path, target)
+        except:
+            os.unlink(tmp_path)
+            raise
+
+def ensure_image_derivative(source, width, fmt):
+    """返回图片副本的路径：已有且不旧于源文件时直接使用，否则用 Pillow 生成；无法生成时返回 None。"""
+    target = image_derivative_path(source, width, fmt)
+    source_mtime = os.stat(source).st_mtime_ns
+
+    def fresh():
+        try:
+            return os.stat(target).st_mtime_ns >= source_mtime
+        except OSError:
+            return False
+
+    if fresh():
+        return target
+    if Image is None or (fmt == '.webp' and not IMAGE_WEBP):
+        return None
+    with _image_build_lock:
+        if not fresh():
+            generate_image_derivative(source, target, width, fmt)
+    return target
+
+def is_image_source(path):
+    """只有 IMAGE_DIRS 下的站点图片才生成缩放副本和 WebP 版本，其他位置（如 uploads/ 中的上传文件）原样返回。"""
+    if os.path.splitext(path)[1].lower() not in IMAGE_EXTS:
+        return False
+    real = os.path.realpath(path)
+    return any(real.startswith(os.path.realpath(d) + os.sep) for d in IMAGE_DIRS)
+
+def select_image_variant(source, accept, width=None):
+    """按 Accept 头和期望宽度选择图片副本，没有更合适的副本时返回源文件。"""
+    ext = os.path.splitext(source)[1].lower()
+    width = choose_image_width(width)
+    try:
+        size = image_size(source)
+    except Exception:
+        size = None
+    if size and width >= size[0]:
+        width = None  # 不放大
+
+    formats = ['.webp', ext] if accepts_image_type(accept, 'image/webp') else [ext]
+    for fmt in formats:
+        if width is None and fmt == ext:
+            break
+        try:
+            target = ensure_image_derivative(source, width, fmt)
+        except Exception as e:
+            write_app_log('ERROR', '生成图片副本失败', {'file': source, 'error': str(e)})
+            target = None
+        if target:
+            return target
+    return source
+
+def build_image_derivatives(dirs=IMAGE_DIRS):
+    """预先为图片目录生成各宽度档位的副本和 WebP 版本，返回处理的图片数量。"""
+    count = 0
+    for directory in dirs:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() not in IMAGE_EXTS:
+                    continue
+                source = os.path.join(dirpath, filename)
+                ext = os.path.splitext(filename)[1].lower()
+                try:
+                    original_width = image_size(source)[0]
+                    widths = [w for w in IMAGE_WIDTHS if w < original_width]
+                    for width in widths:
+                        ensure_image_derivative(source, width, ext)
+                    # 不超过最大档位的图片另有原尺寸的 WebP 版本
+                    if original_width <= IMAGE_WIDTHS[-1]:
+                        widths.append(None)
+                    for width in widths:
+                        ensure_image_derivative(source, width, '.webp')
+                    count += 1
+                except Exception as e:
+                    write_app_log('ERROR', '生成图片副本失败', {'file': source, 'error': str(e)})
+    return count
+
+class StaticFileCache:
+    """按总字节数限制的 LRU 缓存，保存小静态文件（及其压缩结果）的内容，文件的 mtime 或大小变化即失效。"""
+
+    def __init__(self, max_bytes, max_file_size):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.sendfile_count = 0
+        self.sendfile_bytes = 0
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, stamp, data):
+        if len(data) > self.max_file_size or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old[1])
+            self._entries[key] = (stamp, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def note_sendfile(self, nbytes):
+        with self._lock:
+            self.sendfile_count += 1
+            self.sendfile_bytes += nbytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'sendfile': {'responses': self.sendfile_count, 'bytes': self.sendfile_bytes},
+            }
+
+STATIC_CACHE = StaticFileCache(STATIC_CACHE_MAX_BYTES, STATIC_CACHE_MAX_FILE)
+
+def open_static_file(path, encoding=None):
+    """打开静态文件，返回 (文件对象, 长度)；小文件优先从内存缓存读取，encoding 非空时返回压缩后的内容。"""
+    st = os.stat(path)
+    key = (path, encoding)
+    if STATIC_CACHE.max_bytes and st.st_size <= STATIC_CACHE.max_file_size:
+        data = STATIC_CACHE.get(key, (st.st_mtime_ns, st.st_size))
+        if data is not None:
+            return io.BytesIO(data), len(data)
+
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    if not encoding and (not STATIC_CACHE.max_bytes or st.st_size > STATIC_CACHE.max_file_size):
+        return f, st.st_size
+    with f:
+        data = f.read()
+    if encoding:
+        data = compress_body(data, encoding)
+    if STATIC_CACHE.max_bytes:
+        STATIC_CACHE.put(key, (st.st_mtime_ns, st.st_size), data)
+    return io.BytesIO(data), len(data)
+
+def parse_range_header(value, length):
+    """解析 Range 头，返回 [(start, end), ...]（end 包含在内）。
+
+    格式不合法或不是字节范围时返回 None，表示忽略该头；所有范围都无法满足时返回空列表。
+    """
+    unit, _, specs = (value or '').partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or last.isdigit()):
+            return None
+        if not first:
+            # "-N" 表示最后 N 个字节
+            if not last.isdigit():
+                return None
+            suffix = int(last)
+            if suffix > 0 and length > 0:
+                ranges.append((max(0, length - suffix), length - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        end = int(last) if last else length - 1
+        if last and end < start:
+            return None
+        if start < length:
+            ranges.append((start, min(end, length - 1)))
+    if len(ranges) > RANGE_MAX_PARTS:
+        return None
+    return ranges
+
+def if_range_matches(if_range, etag, last_modified):
+    # If-Range 可以是 ETag（只做强比较）或者 HTTP 日期（必须与 Last-Modified 完全一致）
+    if_range = if_range.strip()
+    if if_range.startswith('W/'):
+        return False
+    if if_range.startswith('"'):
+        return if_range == etag
+    return if_range == last_modified
+
+class RangeBody:
+    """206 响应的响应体：由若干段字节串和文件片段组成，发送时按段写出，文件片段不整体读入内存。"""
+
+    def __init__(self, source, parts):
+        self.source = source
+        self.parts = parts
+
+    def close(self):
+        self.source.close()
+
+def count_since(day_counts, start):
+    start = start.isoformat()
+    return sum(n for day, n in day_counts.items() if day >= start)
+
+def open_store(path):
+    if STORAGE_MODE == 'sqlite':
+        return SqliteRecordStore(path)
+    if STORAGE_MODE == 'journal':
+        return JournalRecordStore(path)
+    return JsonRecordStore(path)
+
+REGISTRATIONS = open_store(REGISTRATIONS_FILE)
+CONTACTS = open_store(CONTACTS_FILE)
+
+class RequestProfiler:
+    """按路由抽样的请求性能剖析，默认关闭。
+
+    cprofile 模式把被抽中请求的 cProfile 结果写成 .prof 文件（可用 snakeviz、flameprof 查看）；
+    stack 模式由一个后台线程定时采样被抽中请求所在线程的调用栈，按路由汇总成
+    collapsed-stack 格式的 .folded 文件，可直接交给 flamegraph.pl 或 speedscope。
+    关闭时每个请求只多一次属性判断。
+    """
+
+    MODES = ('cprofile', 'stack')
+
+    def __init__(self, mode=None, sample_rate=PROFILE_SAMPLE_RATE, routes=(), directory=PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stacks = {}
+        self._dirty = set()
+        self._wakeup = threading.Event()
+        self._sampler_pid = None
+        self.samples = {}
+        self.configure(mode, sample_rate, routes)
+
+    def configure(self, mode, sample_rate, routes):
+        if mode not in self.MODES + (None,):
+            raise ValueError(f'mode 只能是 {", ".join(self.MODES)} 或 off')
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('sampleRate 必须在 0 到 1 之间')
+        if isinstance(routes, str) or not all(isinstance(r, str) for r in routes):
+            raise ValueError('routes 必须是路由列表')
+        self.sample_rate = sample_rate
+        self.routes = frozenset(routes)
+        self.mode = mode if sample_rate > 0 else None
+
+    def status(self):
+        with self._lock:
+            return {
+                'mode': self.mode or 'off',
+                'sampleRate': self.sample_rate,
+                'routes': sorted(self.routes),
+                'samples': dict(self.samples),
+                'directory': self.directory,
+            }
+
+    def should_sample(self, route):
+        return (self.mode is not None and (not self.routes or route in self.routes)
+                and random.random() < self.sample_rate)
+
+    def run(self, route, call):
+        mode = self.mode
+        with self._lock:
+            self.samples[route] = self.samples.get(route, 0) + 1
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 新版本 Python 同一时间只允许一个剖析器，其他请求正在剖析时直接执行
+                call()
+                return
+            try:
+                call()
+            finally:
+                profile.disable()
+                self._write_profile(route, profile)
+        else:
+            self._ensure_sampler()
+            ident = threading.get_ident()
+            with self._lock:
+                self._active[ident] = (route, sys._getframe())
+            self._wakeup.set()
+            try:
+                call()
+            finally:
+                with self._lock:
+                    del self._active[ident]
+                self.flush()
+
+    @staticmethod
+    def _slug(route):
+        return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+    def _write_profile(self, route, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        prefix = self._slug(route)
+        profile.dump_stats(os.path.join(self.directory, f'{prefix}-{stamp}-{os.getpid()}.prof'))
+        # 每个路由只保留最近 PROFILE_MAX_FILES 个文件
+        files = sorted(f for f in os.listdir(self.directory) if f.startswith(prefix + '-') and f.endswith('.prof'))
+        for name in files[:-PROFILE_MAX_FILES]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        self._sampler_pid = os.getpid()
+        threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True).start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, (route, boundary) in active.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    # 从叶子向上走到开始剖析的那一帧为止，只保留请求处理部分
+                    while frame is not None and frame is not boundary:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    if stack:
+                        key = ';'.join(reversed(stack))
+                        counts = self._stacks.setdefault(route, {})
+                        counts[key] = counts.get(key, 0) + 1
+                        self._dirty.add(route)
+            time.sleep(PROFILE_STACK_INTERVAL)
+
+    def flush(self):
+        # 每个路由一个 .folded 文件，内容是累计到现在的全部采样
+        with self._lock:
+            dirty = {route: dict(self._stacks[route]) for route in self._dirty}
+            self._dirty.clear()
+        if not dirty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for route, counts in dirty.items():
+            path = os.path.join(self.directory, f'{self._slug(route)}-{os.getpid()}.folded')
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(counts.items()):
+                    f.write(f'{stack} {count}\n')
+            os.replace(tmp_path, path)
+
+PROFILER = RequestProfiler(PROFILE_MODE or None, PROFILE_SAMPLE_RATE,
+                           [r.strip() for r in PROFILE_ROUTES.split(',') if r.strip()])
+
+class IdempotencyCache:
+    """Idempotency-Key -> 首次处理得到的 (状态码, 响应)，保存在 JSON-lines 文件中，prefork 的各进程共用。
+
+    同一个键的请求正在处理时，后到的请求最多等 wait 秒，超时返回 BUSY；
+    处理中的标记超过 2 * wait 秒未完成（处理它的进程可能已退出）时由新请求接手。
+    超过 ttl 秒或容量上限的键被淘汰，文件中失效的行过多时重写文件。
+    """
+
+    BUSY = object()
+
+    def __init__(self, path, ttl, max_keys, wait):
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait = wait
+        # 键 -> (时间, 响应)；响应为 None 表示正在处理
+        self._entries = OrderedDict()
+        self._inode = None
+        self._offset = 0
+        self._lines = 0
+
+    def claim(self, key):
+        """返回该键已有的响应；键没有出现过时登记为处理中并返回 None，调用方处理完后必须调用 finish。"""
+        deadline = time.monotonic() + self.wait
+        while True:
+            with file_lock(self.path):
+                self._refresh()
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is not None:
+                    return entry[1]
+                if entry is None or entry[0] < time.time() - 2 * self.wait:
+                    self._append({'key': key, 'time': time.time()})
+                    return None
+            if time.monotonic() >= deadline:
+                return self.BUSY
+            time.sleep(0.02)
+
+    def finish(self, key, response):
+        # response 为 None（处理失败）时不缓存，客户端可以用同一个键重试
+        with file_lock(self.path):
+            self._refresh()
+            entry = {'key': key, 'time': time.time()}
+            if response is None:
+                entry['release'] = True
+            else:
+                entry['response'] = list(response)
+            self._append(entry)
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._entries.clear()
+            self._inode, self._offset, self._lines = None, 0, 0
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # 其他进程重写了文件，从头读取
+            self._entries.clear()
+            self._inode, self._offset, self._lines = st.st_ino, 0, 0
+        if st.st_size > self._offset:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    write_app_log('WARN', '忽略无法解析的幂等键记录', {'file': self.path})
+                self._lines += 1
+            self._offset += end
+        expired = time.time() - self.ttl
+        while self._entries and (next(iter(self._entries.values()))[0] < expired
+                                 or len(self._entries) > self.max_keys):
+            self._entries.popitem(last=False)
+
+    def _apply(self, entry):
+        key = entry['key']
+        self._entries.pop(key, None)
+        if not entry.get('release'):
+            response = entry.get('response')
+            self._entries[key] = (entry['time'], tuple(response) if response else None)
+
+    def _append(self, entry):
+        self._apply(entry)
+        if self._lines > 2 * len(self._entries) + 1000:
+            self._rewrite()
+            return
+        with open(self.path, 'ab') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+            self._offset = f.tell()
+        self._inode = os.stat(self.path).st_ino
+        self._lines += 1
+
+    def _rewrite(self):
+        # 只保留有效的键，写临时文件后原子替换；其他进程发现 inode 变化后重新读取
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for key, (stamp, response) in self._entries.items():
+                    entry = {'key': key, 'time': stamp}
+                    if response is not None:
+                        entry['response'] = list(response)
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+                self._offset = f.tell()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._inode = os.stat(self.path).st_ino
+        self._lines = len(self._entries)
+
+IDEMPOTENCY_CACHE = IdempotencyCache(IDEMPOTENCY_FILE, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_WAIT)
+
+class Router:
+    """路由表：固定路径用字典直接查找，带 {参数} 的路径按段数分组后逐个匹配。
+
+    每条路由记录处理函数名和中间件名，都是 RegistrationHandler 上的方法；
+    中间件接收下一层的调用函数，可以在其前后做计时、缓存等处理。
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._patterns = {}
+
+    def add(self, methods, pattern, handler, middleware=()):
+        if '{' in pattern:
+            segments = tuple(pattern.split('/'))
+            table = self._patterns.setdefault(len(segments), [])
+            for existing, routes in table:
+                if existing == segments:
+                    break
+            else:
+                routes = {}
+                table.append((segments, routes))
+        else:
+            routes = self._exact.setdefault(pattern, {})
+        for method in methods.split(','):
+            routes[method.strip()] = (handler, tuple(middleware))
+
+    def match(self, method, path):
+        """返回 (路由, 路径参数, 该路径允许的方法, 路由模式)；路径不存在时允许的方法为空。"""
+        routes = self._exact.get(path)
+        params = []
+        matched = path
+        if routes is None:
+            segments = path.split('/')
+            for pattern, candidate in self._patterns.get(len(segments), ()):
+                params = []
+                for expected, actual in zip(pattern, segments):
+                    if expected.startswith('{'):
+                        if not actual:
+                            break
+                        params.append(urllib.parse.unquote(actual))
+                    elif expected != actual:
+                        break
+                else:
+                    routes = candidate
+                    matched = '/'.join(pattern)
+                    break
+        if routes is None:
+            return None, [], (), None
+        route = routes.get(method)
+        allowed = tuple(routes)
+        if 'GET' in routes and 'HEAD' not in routes:
+            # HEAD 按 GET 处理，响应体由 RegistrationHandler.do_HEAD 丢弃
+            allowed += ('HEAD',)
+            if method == 'HEAD':
+                route = routes['GET']
+        return route, params, allowed, matched
+
+ROUTER = Router()
+ROUTER.add('GET', '/admin', 'redirect_admin')
+ROUTER.add('GET', '/admin/', 'redirect_admin')
+ROUTER.add('GET', '/api/registrations', 'serve_registrations_api', ['serve_cached_api'])
+ROUTER.add('GET', '/api/contacts', 'serve_contacts_api', ['serve_cached_api'])
+ROUTER.add('GET', '/api/registrations/export', 'serve_registrations_export')
+ROUTER.add('GET', '/api/contacts/export', 'serve_contacts_export')
+ROUTER.add('GET', '/api/stats', 'serve_stats_api', ['serve_cached_api'])
+ROUTER.add('GET', '/api/trends', 'serve_trends_api', ['serve_cached_api'])
+ROUTER.add('GET', '/api/static-cache', 'serve_static_cache_api')
+ROUTER.add('GET', '/metrics', 'serve_metrics')
+ROUTER.add('GET', '/api/profiling', 'serve_profiling_api')
+ROUTER.add('POST', '/api/profiling', 'handle_profiling_update')
+ROUTER.add('POST', '/submit-registration', 'handle_registration', ['idempotent'])
+ROUTER.add('POST', '/api/contact', 'handle_contact', ['idempotent'])
+ROUTER.add('POST', '/api/import', 'handle_import')
+ROUTER.add('GET', '/api/registrations/{id}', 'serve_registration', ['serve_cached_api'])
+ROUTER.add('GET', '/api/contacts/{id}', 'serve_contact', ['serve_cached_api'])
+ROUTER.add('DELETE', '/api/contacts/{id}', 'handle_delete_contact')
+ROUTER.add('DELETE', '/api/registrations/{id}', 'handle_delete_registration')
+ROUTER.add('POST', '/api/registrations/batch-delete', 'handle_batch_delete_registrations')
+ROUTER.add('POST', '/api/contacts/batch-delete', 'handle_batch_delete_contacts')
+
+class _DiscardWriter:
+    """HEAD 请求写出响应头之后替换 wfile，丢弃处理函数写出的响应体。"""
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' if HTTP_KEEPALIVE else 'HTTP/1.0'
+    # 套接字超时同时作为长连接的空闲超时
+    timeout = KEEPALIVE_TIMEOUT if HTTP_KEEPALIVE else None
+    # 响应头和响应体分两次写出，长连接上开启 Nagle 会与客户端的延迟确认叠加出约 40ms 的停顿
+    disable_nagle_algorithm = True
+    _head_only = False
+
+    def handle(self):
+        self._requests_handled = 0
+        self._park_requested = False
+        self.serve_connection()
+
+    def serve_connection(self):
+        """处理连接上的请求。
+
+        线程池引擎下，长连接处理完一个请求后如果没有已到达的下一个请求，就标记为待停放并返回，
+        由服务器交给空闲连接监视线程，等有数据时再分配工作线程，空闲连接不会占住线程池。
+        """
+        self._body_read = False
+        self.close_connection = True
+        while True:
+            self.raw_requestline = b''
+            try:
+                self.handle_one_request()
+            except ConnectionError:
+                # 客户端在两个请求之间断开了长连接
+                if self.raw_requestline:
+                    raise
+                break
+            if self.close_connection:
+                break
+            if getattr(self.server, 'parks_idle_connections', False) and not self.input_pending():
+                self._park_requested = True
+                break
+
+    def input_pending(self):
+        # 非阻塞地查看下一个请求是否已经到达（流水线请求可能已经在读缓冲区里）；
+        # 客户端通常紧接着发送下一个请求，没到时再短暂等待，避免每个请求都停放、恢复一次
+        try:
+            self.connection.settimeout(0)
+            try:
+                if self.rfile.peek(1):
+                    return True
+            finally:
+                self.connection.settimeout(self.timeout)
+            return KEEPALIVE_PARK_DELAY > 0 and wait_readable(self.connection, KEEPALIVE_PARK_DELAY)
+        except (OSError, ValueError):
+            # 交给下一次读取去处理连接错误
+            return True
+
+    def finish(self):
+        # 停放的连接保持打开，之后由服务器恢复处理或在空闲超时后关闭
+        if not getattr(self, '_park_requested', False):
+            super().finish()
+
+    def handle_one_request(self):
+        # 请求解析成功后开始计时，处理完成（包括出错）后记录指标
+        self._request_started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_started is not None:
+                self.record_request_metrics(time.perf_counter() - self._request_started)
+
+    def parse_request(self):
+        self._requests_handled += 1
+        self._body_read = False
+        self._status = 0
+        self._response_length = 0
+        self._route_label = 'static'
+        if not super().parse_request():
+            return False
+        self._request_started = time.perf_counter()
+        METRICS.request_started()
+        # 在处理函数读取请求体之前检查（asyncio 引擎对这两类请求不会把请求体读入内存）
+        rejection = self.body_rejection()
+        if rejection is not None:
+            if rejection[0] == 413:
+                write_app_log('WARN', '请求体过大', {'url': self.path, 'length': self.headers.get('Content-Length'),
+                                                 'ip': self.client_address[0]})
+            self.send_error(rejection[0], explain=rejection[1])
+            return False
+        return True
+
+    def body_rejection(self):
+        """请求体不能接受时返回 (状态码, 说明)：分块传输返回 411，超过 REQUEST_MAX_BYTES 返回 413。"""
+        if 'Transfer-Encoding' in self.headers:
+            return 411, '不支持分块传输的请求体，请带 Content-Length 发送'
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if length > REQUEST_MAX_BYTES:
+            return 413, f'请求体超过 {REQUEST_MAX_BYTES} 字节的上限'
+        return None
+
+    def handle_expect_100(self):
+        # 请求体会被拒绝时不回复 100 Continue，客户端不必上传，由 parse_request 直接返回错误
+        if self.body_rejection() is not None:
+            return True
+        return super().handle_expect_100()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self._response_length = int(value)
+        super().send_header(keyword, value)
+
+    def record_request_metrics(self, seconds):
+        try:
+            request_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            request_length = 0
+        METRICS.request_finished(self.command, self._route_label, self._status, seconds,
+                                 request_length, self._response_length)
+        if ACCESS_LOG:
+            LOGGER.access({
+                'method': self.command,
+                'url': self.path,
+                'ip': self.client_address[0],
+                'userAgent': self.headers.get('User-Agent'),
+                'statusCode': self._status,
+                'responseTime': f'{seconds * 1000:.0f}ms',
+                'contentLength': self._response_length,
+            })
+        if seconds > SLOW_REQUEST_THRESHOLD:
+            write_app_log('WARN', '慢请求检测', {
+                'method': self.command,
+                'url': self.path,
+                'responseTime': f'{seconds * 1000:.0f}ms',
+                'statusCode': self._status,
+                'ip': self.client_address[0],
+            })
+
+    def end_headers(self):
+        # 请求体没有读完（下一个请求无法解析）或者已处理满最大请求数时关闭连接
+        if not self.close_connection:
+            if self._requests_handled >= KEEPALIVE_MAX_REQUESTS or self.has_unread_body():
+                self.send_header('Connection', 'close')
+            elif self.request_version == 'HTTP/1.0':
+                self.send_header('Connection', 'keep-alive')
+        super().end_headers()
+        if self._head_only:
+            self.wfile = _DiscardWriter()
+
+    def read_body(self, length):
+        body = self.rfile.read(length)
+        self._body_read = True
+        return body
+
+    def has_unread_body(self):
+        if self._body_read:
+            return False
+        if 'Transfer-Encoding' in self.headers:
+            return True
+        try:
+            return int(self.headers.get('Content-Length') or 0) > 0
+        except ValueError:
+            return True
+
+    def log_error(self, format, *args):
+        # 长连接在等待下一个请求时超时属于正常关闭，不记录
+        if not self.raw_requestline and format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+    def log_request(self, code='-', size='-'):
+        # 访问日志在 record_request_metrics 中写入（带处理耗时）
+        pass
+
+    def log_message(self, format, *args):
+        # 交给后台日志线程，不在请求线程上写 stderr
+        LOGGER.log('WARN', format % args, {'ip': self.client_address[0], 'requestLine': getattr(self, 'requestline', '')})
 
-class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
     def do_OPTIONS(self):
         # 处理CORS预检请求
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_POST(self):
-        if self.path == '/submit-registration':
-            self.handle_registration()
-        elif self.path == '/api/contact':
-            self.handle_contact()
-        else:
+        if not self.dispatch():
+            self.send_error(404)
+    
+    def do_PUT(self):
+        if not self.dispatch():
+            self.send_error(404)
+    
+    def do_PATCH(self):
+        if not self.dispatch():
             self.send_error(404)
     
     def do_DELETE(self):
-        # 处理删除请求
-        if self.path.startswith('/api/contacts/'):
-            self.handle_delete_contact()
-        else:
+        if not self.dispatch():
             self.send_error(404)
     
     def do_GET(self):
-        if self.path == '/admin':
-            # 重定向到新的顶峰教育管理系统
-            self.send_response(301)
-            self.send_header('Location', '/admin/index.html')
-            self.end_headers()
-        elif self.path == '/admin/':
-            # 重定向到新的顶峰教育管理系统
-            self.send_response(301)
-            self.send_header('Location', '/admin/index.html')
-            self.end_headers()
-        elif self.path.startswith('/admin/') and self.path != '/admin':
-            # 处理admin目录下的静态文件
+        if not self.dispatch():
+            # 默认处理静态文件（包括 admin 目录）
             super().do_GET()
-        elif self.path == '/api/registrations':
-            self.serve_registrations_api()
-        elif self.path == '/api/contacts':
-            self.serve_contacts_api()
-        elif self.path == '/api/stats':
-            self.serve_stats_api()
-        elif self.path.startswith('/api/trends'):
-            self.serve_trends_api()
+    
+    def do_HEAD(self):
+        # 与 GET 走同一个处理流程，响应头写出后丢弃响应体
+        self._head_only = True
+        wfile = self.wfile
+        try:
+            if not self.dispatch():
+                super().do_HEAD()
+        finally:
+            self._head_only = False
+            self.wfile = wfile
+    
+    def dispatch(self):
+        """按路由表分发请求，查询参数在这里统一解析一次；没有匹配的路由时返回 False。"""
+        url = urllib.parse.urlsplit(self.path)
+        self.query = urllib.parse.parse_qs(url.query)
+        route, params, allowed, pattern = ROUTER.match(self.command, url.path)
+        if not allowed:
+            return False
+        self._route_label = pattern
+        if route is None:
+            self.send_json({'error': '不支持的请求方法'}, 405, headers={'Allow': ', '.join(allowed + ('OPTIONS',))})
+            return True
+        
+        handler_name, middleware = route
+        call = functools.partial(getattr(self, handler_name), *params)
+        for name in reversed(middleware):
+            call = functools.partial(getattr(self, name), call)
+        if PROFILER.mode is not None and PROFILER.should_sample(pattern):
+            PROFILER.run(pattern, call)
         else:
-            # 默认处理静态文件
-            super().do_GET()
+            call()
+        return True
+    
+    def redirect_admin(self):
+        # 重定向到新的顶峰教育管理系统
+        self.send_response(301)
+        self.send_header('Location', '/admin/index.html')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def serve_static_cache_api(self):
+        self.send_json(STATIC_CACHE.stats(), headers={'Cache-Control': 'no-store'})
+    
+    def serve_profiling_api(self):
+        self.send_json(PROFILER.status(), headers={'Cache-Control': 'no-store'})
+    
+    def handle_profiling_update(self):
+        # 管理后台开关性能剖析：{"mode": "stack" | "cprofile" | "off", "sampleRate": 0.05, "routes": ["/api/stats"]}
+        try:
+            data = json.loads(self.read_body(int(self.headers['Content-Length'])).decode('utf-8'))
+            mode = data.get('mode', PROFILER.mode or 'off')
+            PROFILER.configure(None if mode == 'off' else mode,
+                               float(data.get('sampleRate', PROFILER.sample_rate)),
+                               data.get('routes', PROFILER.routes))
+        except (TypeError, ValueError, AttributeError) as e:
+            self.send_json({'error': f'参数错误: {e}'}, 400)
+            return
+        write_app_log('INFO', '性能剖析已更新', PROFILER.status())
+        self.send_json(PROFILER.status())
+    
+    def serve_metrics(self):
+        # Prometheus 文本格式
+        body = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
     
     def handle_registration(self):
         try:
             # 获取POST数据
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            post_data = self.read_body(content_length)
             
             # 解析表单数据
             form_data = urllib.parse.parse_qs(post_data.decode('utf-8'))
             
             # 处理表单数据
             registration = {
-                'id': int(datetime.datetime.now().timestamp() * 1000),
+                'id': ID_GENERATOR.next_id(),
                 'submitTime': datetime.datetime.now().isoformat(),
             }
             
@@ -90,129 +3394,441 @@ class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
             for key, value in form_data.items():
                 registration[key] = value[0] if len(value) == 1 else value
             
-            # 读取现有数据
-            registrations = []
-            if os.path.exists(REGISTRATIONS_FILE):
-                with open(REGISTRATIONS_FILE, 'r', encoding='utf-8') as f:
-                    registrations = json.load(f)
-            
-            # 添加新数据
-            registrations.append(registration)
-            
-            # 保存数据
-            with open(REGISTRATIONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(registrations, f, ensure_ascii=False, indent=2)
-            
-            print(f"新的报名申请: {registration.get('name', '未知')} - ID: {registration['id']}")
+            # 保存数据（只追加新记录，不重写整个文件）；窗口内的重复提交按 DEDUPE_MODE 处理
+            stored, existing = REGISTRATIONS.append_unique(registration, DEDUPE_WINDOW, DEDUPE_MODE)
             
-            # 返回成功响应
-            response = json.dumps({
-                'success': True, 
-                'message': '报名申请提交成功', 
-                'id': registration['id']
-            }, ensure_ascii=False)
+            if existing is not None:
+                write_app_log('INFO', '重复的报名申请', {'id': stored['id'], 'duplicateOf': existing['id'],
+                                                   'name': stored.get('name', '未知'), 'mode': DEDUPE_MODE})
+            else:
+                write_app_log('INFO', '新的报名申请', {'id': stored['id'], 'name': stored.get('name', '未知')})
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_submission(stored, existing, '报名申请提交成功')
             
         except Exception as e:
-            print(f"处理报名申请时出错: {e}")
-            error_response = json.dumps({
+            write_app_log('ERROR', '处理报名申请时出错', {'error': str(e)})
+            self.send_json({
                 'success': False, 
                 'message': '服务器错误'
-            }, ensure_ascii=False)
-            
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(error_response.encode('utf-8'))
+            }, 500)
+    
+    def send_submission(self, stored, existing, message):
+        # 重复提交的响应带 duplicate 和 duplicateOf（首次提交的 ID）；reject 模式下没有保存，返回 409
+        if existing is None:
+            self.send_json({'success': True, 'message': message, 'id': stored['id'], 'duplicate': False})
+        elif DEDUPE_MODE == 'reject':
+            self.send_json({'success': False, 'message': '您已提交过相同的信息，请勿重复提交',
+                            'id': existing['id'], 'duplicate': True, 'duplicateOf': existing['id']}, 409)
+        else:
+            self.send_json({'success': True, 'message': message, 'id': stored['id'], 'duplicate': True,
+                            'duplicateOf': existing['id'], 'merged': DEDUPE_MODE == 'merge'})
     
     def serve_registrations_api(self):
+        self.serve_record_list(REGISTRATIONS, '报名')
+    
+    def serve_record_list(self, store, label):
+        if self.wants_ndjson():
+            self.serve_record_stream(store)
+            return
         try:
-            registrations = []
-            if os.path.exists(REGISTRATIONS_FILE):
-                with open(REGISTRATIONS_FILE, 'r', encoding='utf-8') as f:
-                    registrations = json.load(f)
+            query_params = self.query
             
-            # 按提交时间倒序排列
-            registrations.sort(key=lambda x: x.get('submitTime', ''), reverse=True)
+            if not any(name in query_params for name in LIST_QUERY_PARAMS):
+                # 不带分页、筛选等参数时保持原来的行为：按提交时间倒序返回全部数据
+                records = store.all()
+                records.sort(key=lambda x: x.get('submitTime', ''), reverse=True)
+                self.send_json(records, headers={'X-Total-Count': str(len(records))})
+                return
             
-            response = json.dumps(registrations, ensure_ascii=False)
+            try:
+                spec = parse_list_query(query_params)
+            except ValueError as e:
+                self.send_json({'error': f'参数错误: {e}'}, 400)
+                return
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            total, page, next_key = store.query(spec)
+            self.send_json({
+                'data': [project_record(r, spec['fields']) for r in page],
+                'total': total,
+                'page': spec['page'] if spec['cursor'] is None else None,
+                'limit': spec['limit'],
+                'nextCursor': encode_cursor(next_key) if next_key else None
+            }, headers={'X-Total-Count': str(total)})
             
         except Exception as e:
-            print(f"获取报名数据时出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            write_app_log('ERROR', f'获取{label}数据时出错', {'error': str(e)})
+            self.send_json({'error': '服务器错误'}, 500)
+    
+    def serve_cached_api(self, handler):
+        # ETag 由请求地址和数据版本计算，数据没变时不执行处理函数直接返回 304
+        self._encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        versions = f'{REGISTRATIONS.data_tag()}|{CONTACTS.data_tag()}|{datetime.date.today()}'
+        # 同一地址的 JSON 和 NDJSON 响应内容不同，ETag 也要区分
+        variant = 'ndjson' if self.wants_ndjson() else 'json'
+        digest = hashlib.sha1(f'{self.path}|{variant}|{versions}'.encode('utf-8')).hexdigest()[:24]
+        self._etag = f'"{digest}-{self._encoding}"' if self._encoding else f'"{digest}"'
+        try:
+            if etag_matches(self.headers.get('If-None-Match'), self._etag):
+                self.send_response(304)
+                self.send_header('ETag', self._etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return
+            handler()
+        finally:
+            self._etag = None
+            self._encoding = None
+    
+    def idempotent(self, handler):
+        # 带 Idempotency-Key 请求头的提交：同一个键重试时直接返回首次的响应，不会重复保存
+        key = (self.headers.get('Idempotency-Key') or '').strip()
+        if not key:
+            handler()
+            return
+        if len(key) > 255:
+            self.send_json({'success': False, 'message': 'Idempotency-Key 过长'}, 400)
+            return
+        cache_key = f'{self.command} {self._route_label} {key}'
+        cached = IDEMPOTENCY_CACHE.claim(cache_key)
+        if cached is IDEMPOTENCY_CACHE.BUSY:
+            self.send_json({'success': False, 'message': '相同 Idempotency-Key 的请求正在处理，请稍后重试'}, 409,
+                           {'Retry-After': '1'})
+            return
+        if cached is not None:
+            status, data = cached
+            write_app_log('INFO', '重复请求（Idempotency-Key）', {'route': self._route_label, 'key': key})
+            self.send_json(data, status, {'Idempotent-Replayed': 'true'})
+            return
+        self._captured_response = None
+        try:
+            handler()
+        finally:
+            captured = self._captured_response
+            self._captured_response = False
+            IDEMPOTENCY_CACHE.finish(cache_key, captured if captured and captured[0] < 500 else None)
+
+    def send_json(self, data, status=200, headers=None):
+        # idempotent 中间件记录本次请求的第一个响应
+        if getattr(self, '_captured_response', False) is None:
+            self._captured_response = (status, data)
+        response = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        encoding = getattr(self, '_encoding', None)
+        if encoding and len(response) >= COMPRESS_MIN_SIZE:
+            response = compress_body(response, encoding)
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(response)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if status == 200 and getattr(self, '_etag', None):
+            self.send_header('ETag', self._etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response)
+
+    def send_head(self):
+        # 优先使用构建好的静态资源（带哈希的文件名、预压缩文件）
+        url_path = urllib.parse.unquote(self.path.split('?', 1)[0].split('#', 1)[0])
+        asset = resolve_static_asset(url_path)
+        if asset:
+            return self.send_built_asset(*asset)
+        
+        # 静态文件：支持 ETag/Last-Modified 协商缓存，文本类文件按 Accept-Encoding 压缩
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?', 1)[0].endswith('/'):
+            for index in ('index.html', 'index.htm'):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+        if not os.path.isfile(path) or path.endswith('/'):
+            return super().send_head()
+        if is_image_source(path):
+            return self.send_image(path, f'public, max-age={STATIC_MAX_AGE}')
+
+        ctype = self.guess_type(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        encoding = None
+        if is_compressible(ctype) and st.st_size >= COMPRESS_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}' + (f'-{encoding}"' if encoding else '"')
+        last_modified = self.date_time_string(int(st.st_mtime))
+
+        if self.is_not_modified(etag, st.st_mtime):
+            self.send_not_modified(etag, last_modified, f'public, max-age={STATIC_MAX_AGE}')
+            return None
+        try:
+            f, length = open_static_file(path, encoding)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        headers = [('Last-Modified', last_modified), ('ETag', etag),
+                   ('Cache-Control', f'public, max-age={STATIC_MAX_AGE}'), ('Vary', 'Accept-Encoding')]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        return self.send_file_response(f, length, ctype, etag, last_modified, headers)
+
+    def send_built_asset(self, entry, immutable):
+        # 带哈希的地址内容永远不变；HTML 入口页面每次都要重新验证，才能及时引用新的资源地址
+        if immutable:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        elif entry['url'] is None:
+            cache_control = 'no-cache'
+        else:
+            cache_control = f'public, max-age={STATIC_MAX_AGE}'
+        if not entry['built'] and is_image_source(entry['source']):
+            return self.send_image(entry['source'], cache_control)
+        
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), entry['encodings'])
+        path = os.path.join(STATIC_BUILD_DIR, entry['built']) if entry['built'] else entry['source']
+        if encoding:
+            path += '.br' if encoding == 'br' else '.gz'
+        etag = f'"{entry["hash"]}-{encoding}"' if encoding else f'"{entry["hash"]}"'
+        mtime = entry['mtime_ns'] / 1e9
+        last_modified = self.date_time_string(int(mtime))
+        
+        if self.is_not_modified(etag, mtime):
+            self.send_not_modified(etag, last_modified, cache_control)
+            return None
+        try:
+            f, length = open_static_file(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        headers = [('Last-Modified', last_modified), ('ETag', etag), ('Cache-Control', cache_control)]
+        if entry['encodings']:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        return self.send_file_response(f, length, self.guess_type(entry['source']), etag, last_modified, headers)
+
+    def send_image(self, source, cache_control):
+        # 图片：按 Accept 头（是否支持 WebP）和 w 参数（期望宽度）返回最合适的副本
+        # 查询参数已由 dispatch 解析
+        query = self.query
+        try:
+            width = int(query['w'][0]) if 'w' in query else None
+        except ValueError:
+            width = None
+        path = select_image_variant(source, self.headers.get('Accept'), width)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        last_modified = self.date_time_string(int(st.st_mtime))
+        
+        if self.is_not_modified(etag, st.st_mtime):
+            self.send_not_modified(etag, last_modified, cache_control, vary='Accept')
+            return None
+        try:
+            f, length = open_static_file(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        headers = [('Last-Modified', last_modified), ('ETag', etag),
+                   ('Cache-Control', cache_control), ('Vary', 'Accept')]
+        return self.send_file_response(f, length, self.guess_type(path), etag, last_modified, headers)
+
+    def send_file_response(self, f, length, ctype, etag, last_modified, headers):
+        # 返回完整内容，或按 Range 头返回 206（单个范围直接返回，多个范围用 multipart/byteranges）
+        ranges = None
+        range_header = self.headers.get('Range')
+        if range_header:
+            if_range = self.headers.get('If-Range')
+            if not if_range or if_range_matches(if_range, etag, last_modified):
+                ranges = parse_range_header(range_header, length)
+        if ranges == []:
+            f.close()
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{length}')
+            self.send_header('Content-Length', '0')
             self.end_headers()
-            self.wfile.write('{"error": "服务器错误"}'.encode('utf-8'))
+            return None
+        
+        if not ranges:
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(length))
+            body = f
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.send_response(206)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{length}')
+            self.send_header('Content-Length', str(end - start + 1))
+            body = RangeBody(f, [(start, end - start + 1)])
+        else:
+            boundary = os.urandom(12).hex()
+            parts = []
+            total = 0
+            for start, end in ranges:
+                head = (f'\r\n--{boundary}\r\nContent-Type: {ctype}\r\n'
+                        f'Content-Range: bytes {start}-{end}/{length}\r\n\r\n').encode('latin-1')
+                parts += [head, (start, end - start + 1)]
+                total += len(head) + end - start + 1
+            tail = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+            parts.append(tail)
+            total += len(tail)
+            self.send_response(206)
+            self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+            self.send_header('Content-Length', str(total))
+            body = RangeBody(f, parts)
+        self.send_header('Accept-Ranges', 'bytes')
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        return body
+
+    def copyfile(self, source, outputfile):
+        # 磁盘上的文件用 sendfile 由内核直接发送；内存缓存里的内容照常写出
+        if isinstance(source, RangeBody):
+            self.copy_ranges(source, outputfile)
+        elif self.can_sendfile(source, outputfile):
+            STATIC_CACHE.note_sendfile(self.connection.sendfile(source))
+        else:
+            super().copyfile(source, outputfile)
+
+    def can_sendfile(self, source, outputfile):
+        return (STATIC_SENDFILE and isinstance(source, io.BufferedReader)
+                and outputfile is self.wfile and hasattr(self.connection, 'sendfile'))
+
+    def copy_ranges(self, body, outputfile):
+        # 文件片段用 sendfile 按偏移发送；不能 sendfile 时通过 mmap（或缓存内容的内存视图）切片写出，不复制整个文件
+        source = body.source
+        use_sendfile = self.can_sendfile(source, outputfile)
+        mapped = None
+        view = None
+        try:
+            if isinstance(source, io.BytesIO):
+                view = source.getbuffer()
+            elif not use_sendfile:
+                mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)
+            for part in body.parts:
+                if isinstance(part, bytes):
+                    outputfile.write(part)
+                    continue
+                offset, count = part
+                if use_sendfile:
+                    STATIC_CACHE.note_sendfile(self.connection.sendfile(source, offset, count))
+                else:
+                    outputfile.write(view[offset:offset + count])
+        finally:
+            if view is not None:
+                view.release()
+            if mapped is not None:
+                mapped.close()
+
+    def send_not_modified(self, etag, last_modified, cache_control, vary='Accept-Encoding'):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', vary)
+        self.end_headers()
+
+    def is_not_modified(self, etag, mtime):
+        # If-None-Match 优先；没有时才看 If-Modified-Since
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return since is not None and int(mtime) <= since.timestamp()
     
-    def handle_delete_contact(self):
+    def serve_registration(self, registration_id):
+        self.serve_record(REGISTRATIONS, registration_id, '报名')
+
+    def serve_contact(self, contact_id):
+        self.serve_record(CONTACTS, contact_id, '联系')
+
+    def serve_record(self, store, record_id, label):
+        record = store.get(record_id)
+        if record is None:
+            self.send_json({'error': f'{label}记录不存在', 'message': f'{label}记录不存在'}, 404)
+            return
+        self.send_json(record)
+
+    def handle_delete_contact(self, contact_id):
+        self.delete_record(CONTACTS, contact_id, '联系')
+
+    def handle_delete_registration(self, registration_id):
+        self.delete_record(REGISTRATIONS, registration_id, '报名')
+
+    def delete_record(self, store, record_id, label):
         try:
-            # 从URL中提取联系信息ID
-            contact_id = self.path.split('/')[-1]
-            
-            # 读取现有联系数据
-            contacts = []
-            if os.path.exists(CONTACTS_FILE):
-                with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-                    contacts = json.load(f)
+            # 删除匹配的记录并保存
+            deleted = store.delete_ids([record_id])
             
-            # 查找要删除的联系信息
-            original_count = len(contacts)
-            contacts = [c for c in contacts if str(c.get('id', c.get('timestamp', ''))) != contact_id]
-            
-            if len(contacts) == original_count:
+            if not deleted:
                 # 没有找到要删除的记录
-                self.send_response(404)
-                self.send_header('Content-Type', 'application/json; charset=utf-8')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write('{"error": "联系记录不存在"}'.encode('utf-8'))
+                self.send_json({'error': f'{label}记录不存在', 'message': f'{label}记录不存在'}, 404)
                 return
             
-            # 保存更新后的数据
-            with open(CONTACTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(contacts, f, ensure_ascii=False, indent=2)
-            
-            print(f"删除联系记录: ID {contact_id}")
+            write_app_log('INFO', f'删除{label}记录', {'id': record_id})
             
             # 返回成功响应
-            response = json.dumps({"message": "联系记录删除成功"}, ensure_ascii=False)
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_json({"message": f"{label}记录删除成功"})
             
         except Exception as e:
-            print(f"删除联系记录时出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write('{"error": "删除失败"}'.encode('utf-8'))
+            write_app_log('ERROR', f'删除{label}记录时出错', {'id': record_id, 'error': str(e)})
+            self.send_json({'error': '删除失败', 'message': '删除失败'}, 500)
+
+    def handle_batch_delete_registrations(self):
+        self.batch_delete(REGISTRATIONS, '报名')
+
+    def handle_batch_delete_contacts(self):
+        self.batch_delete(CONTACTS, '联系')
+
+    def batch_delete(self, store, label):
+        """请求体为 {"ids": [...]}：整批 ID 放进集合，一次遍历删除并只写一次存储。"""
+        try:
+            data = json.loads(self.read_body(int(self.headers.get('Content-Length') or 0)).decode('utf-8'))
+            ids = data.get('ids') if isinstance(data, dict) else None
+        except (ValueError, UnicodeDecodeError):
+            ids = None
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, (str, int)) for i in ids):
+            self.send_json({'success': False, 'message': 'ids 必须是非空的 ID 数组'}, 400)
+            return
+        try:
+            deleted = store.delete_ids(ids)
+        except Exception as e:
+            write_app_log('ERROR', f'批量删除{label}记录时出错', {'count': len(ids), 'error': str(e)})
+            self.send_json({'success': False, 'message': '删除失败'}, 500)
+            return
+        write_app_log('INFO', f'批量删除{label}记录', {'requested': len(ids), 'deleted': deleted})
+        self.send_json({'success': True, 'deleted': deleted, 'message': f'成功删除 {deleted} 条{label}记录'})
     
     def handle_contact(self):
         try:
             # 获取POST数据
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            post_data = self.read_body(content_length)
             
             # 解析JSON数据
             contact_data = json.loads(post_data.decode('utf-8'))
             
             # 处理联系信息
             contact = {
-                'id': int(datetime.datetime.now().timestamp() * 1000),
+                'id': ID_GENERATOR.next_id(),
                 'name': contact_data.get('name', ''),
                 'phone': contact_data.get('phone', ''),
                 'timestamp': contact_data.get('timestamp', datetime.datetime.now().isoformat()),
@@ -220,232 +3836,282 @@ class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
                 'submitTime': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
-            # 保存到文件
-            contacts = []
-            if os.path.exists(CONTACTS_FILE):
-                with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-                    contacts = json.load(f)
-            
-            contacts.append(contact)
-            
-            with open(CONTACTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(contacts, f, ensure_ascii=False, indent=2)
-            
-            # 返回成功响应
-            response = json.dumps({
-                'success': True,
-                'message': '联系信息提交成功',
-                'id': contact['id']
-            }, ensure_ascii=False)
+            # 保存到文件；窗口内的重复提交按 DEDUPE_MODE 处理
+            stored, existing = CONTACTS.append_unique(contact, DEDUPE_WINDOW, DEDUPE_MODE)
+            if existing is not None:
+                write_app_log('INFO', '重复的联系请求', {'id': stored['id'], 'duplicateOf': existing['id'],
+                                                   'name': stored.get('name'), 'mode': DEDUPE_MODE})
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_submission(stored, existing, '联系信息提交成功')
             
         except Exception as e:
-            print(f"处理联系信息时出错: {e}")
-            error_response = json.dumps({
+            write_app_log('ERROR', '处理联系信息时出错', {'error': str(e)})
+            self.send_json({
                 'success': False,
                 'message': '服务器错误'
-            }, ensure_ascii=False)
-            
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(error_response.encode('utf-8'))
+            }, 500)
     
+    def handle_import(self):
+        """POST /api/import：批量导入 CSV 或 JSON 数组。
+
+        请求体可以是管理后台上传的 multipart/form-data（字段 file、type、overwrite），
+        也可以直接是 CSV/JSON 内容（type、overwrite 放在查询参数里）。逐行校验、去重，
+        合格的记录一次性写入存储，不合格的行在 errors 中列出行号和原因。
+        """
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_json({'success': False, 'message': '缺少 Content-Length'}, 411)
+            return
+        if length > IMPORT_MAX_BYTES:
+            self.send_json({'success': False, 'message': f'请求体超过 {IMPORT_MAX_BYTES} 字节的上限'}, 413)
+            return
+        body = RequestBody(self, length)
+        progress = {'committed': 0}
+        options = {name: values[0] for name, values in self.query.items()}
+        content_type = self.headers.get('Content-Type') or ''
+        try:
+            if content_type.lower().startswith('multipart/form-data'):
+                boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+                if not boundary:
+                    raise ValueError('multipart 请求缺少 boundary')
+                with tempfile.SpooledTemporaryFile(IMPORT_SPOOL_SIZE) as upload:
+                    fields, filename = read_multipart(body, boundary.group(1), upload)
+                    options.update(fields)
+                    if filename is None:
+                        raise ValueError('没有上传文件')
+                    upload.seek(0)
+                    result = self.import_records(upload, options, progress)
+            else:
+                result = self.import_records(body, options, progress)
+        except ValueError as e:
+            self.send_json({'success': False, 'message': f'导入失败: {e}', 'committed': progress['committed']}, 400)
+            return
+        except ConnectionError as e:
+            # 客户端在上传过程中断开，没有可以回复的连接
+            write_app_log('WARN', '批量导入时连接中断', {'error': str(e), 'committed': progress['committed']})
+            self.close_connection = True
+            return
+        except Exception as e:
+            # 读取上传、写入存储等出错（OSError、sqlite3.Error 等），告诉客户端已提交了多少条
+            write_app_log('ERROR', '批量导入时出错', {'error': repr(e), 'committed': progress['committed']})
+            self.send_json({'success': False, 'message': '导入时服务器出错', 'committed': progress['committed']}, 500)
+            return
+        self.send_json(result)
+
+    def import_records(self, stream, options, progress):
+        kind = options.get('type', 'registrations')
+        if kind not in EXPORT_COLUMNS:
+            raise ValueError(f'不支持的数据类型: {kind}')
+        overwrite = options.get('overwrite', '').lower() in ('1', 'true', 'on', 'yes')
+        store = REGISTRATIONS if kind == 'registrations' else CONTACTS
+        text, is_json = open_import_text(stream)
+        rows = iter_json_array(text) if is_json else iter_csv_rows(text)
+
+        records = []
+        errors = []
+        failed = 0
+        for count, (row_number, row) in enumerate(rows, 1):
+            if count > IMPORT_MAX_ROWS:
+                raise ValueError(f'一次最多导入 {IMPORT_MAX_ROWS} 条')
+            try:
+                records.append((row_number, normalize_import_record(kind, row)))
+            except ValueError as e:
+                failed += 1
+                errors.append({'row': row_number, 'error': str(e)})
+
+        # 去重：ID 已存在，或与已有记录的查重键相同（与表单提交的查重规则一致，但不限时间窗口；
+        # 覆盖导入时只在文件内部去重）
+        existing_ids = set() if overwrite else store.existing_ids(r['id'] for _, r in records if 'id' in r)
+        known = set() if overwrite else store.existing_dedupe_keys(k for _, r in records for k in dedupe_keys(r))
+        accepted = []
+        duplicates = 0
+        for row_number, record in records:
+            keys = dedupe_keys(record)
+            if str(record.get('id')) in existing_ids or not known.isdisjoint(keys):
+                duplicates += 1
+                errors.append({'row': row_number, 'error': f'重复记录: {record["name"]} {record["phone"]}'})
+                continue
+            known.update(keys)
+            if 'id' in record:
+                existing_ids.add(str(record['id']))
+            else:
+                record = {'id': ID_GENERATOR.next_id(), **record}
+            accepted.append(record)
+
+        if overwrite:
+            store.replace_all(accepted)
+        else:
+            store.extend(accepted)
+        # 各存储的整批写入都是原子的，写入返回后这批记录才算已提交
+        progress['committed'] = len(accepted)
+        errors.sort(key=lambda e: e['row'])
+        label = '报名' if kind == 'registrations' else '联系'
+        write_app_log('INFO', '批量导入完成', {'type': kind, 'overwrite': overwrite, 'imported': len(accepted),
+                                         'duplicates': duplicates, 'failed': failed})
+        return {
+            'success': True,
+            'message': f'成功导入 {len(accepted)} 条{label}数据',
+            'imported': len(accepted),
+            'duplicates': duplicates,
+            'failed': failed,
+            'total': store.count(),
+            'errors': errors[:IMPORT_MAX_ERRORS],
+        }
+
     def serve_contacts_api(self):
+        self.serve_record_list(CONTACTS, '联系')
+
+    def wants_ndjson(self):
+        accept = self.headers.get('Accept') or ''
+        return 'application/x-ndjson' in accept or self.query.get('stream', ['0'])[0] in ('1', 'true')
+
+    def serve_record_stream(self, store):
+        """NDJSON 模式：按 q/from/to/sort/fields 参数逐条发送全部匹配记录（不分页），首字节时间和内存占用与数据量无关。"""
         try:
-            contacts = []
-            if os.path.exists(CONTACTS_FILE):
-                with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-                    contacts = json.load(f)
-            
-            # 按提交时间倒序排列
-            contacts.sort(key=lambda x: x.get('submitTime', ''), reverse=True)
-            
-            response = json.dumps(contacts, ensure_ascii=False)
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
-            
+            spec = parse_list_query(self.query)
+        except ValueError as e:
+            self.send_json({'error': f'参数错误: {e}'}, 400)
+            return
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), ('gzip',))
+        self.send_stream(iter_ndjson(store.iter_query(spec), spec['fields']), 'application/x-ndjson; charset=utf-8',
+                         {'Vary': 'Accept, Accept-Encoding'}, encoding)
+
+    def serve_registrations_export(self):
+        self.serve_record_export(REGISTRATIONS, 'registrations', '报名数据')
+
+    def serve_contacts_export(self):
+        self.serve_record_export(CONTACTS, 'contacts', '联系数据')
+
+    def serve_record_export(self, store, kind, title):
+        """按列表接口相同的 q/from/to/sort 参数导出全部匹配记录，format=csv（默认）或 xlsx，边查询边发送。"""
+        export_format = self.query.get('format', ['csv'])[0].lower()
+        if export_format not in ('csv', 'xlsx'):
+            self.send_json({'error': f'不支持的导出格式: {export_format}'}, 400)
+            return
+        try:
+            spec = parse_list_query(self.query)
+        except ValueError as e:
+            self.send_json({'error': f'参数错误: {e}'}, 400)
+            return
+        columns = EXPORT_COLUMNS[kind]
+        if spec['fields']:
+            headers = dict(columns)
+            columns = [(field, headers.get(field, field)) for field in spec['fields']]
+        
+        records = store.iter_query(spec)
+        if export_format == 'csv':
+            chunks = iter_csv_export(records, columns)
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            chunks = iter_xlsx_export(records, columns, title)
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename = f'{title}_{datetime.date.today().isoformat()}.{export_format}'
+        disposition = (f'attachment; filename="{kind}-{datetime.date.today().isoformat()}.{export_format}"; '
+                       f"filename*=UTF-8''{urllib.parse.quote(filename)}")
+        self.send_stream(chunks, content_type, {'Content-Disposition': disposition})
+
+    def send_stream(self, chunks, content_type, headers=None, encoding=None):
+        """以分块传输编码发送 chunks 产出的响应体；HTTP/1.0 不支持分块，发送完后关闭连接表示结束。"""
+        if encoding == 'gzip':
+            chunks = gzip_chunks(chunks)
+        try:
+            # 先取第一段，查询出错时还能返回 500
+            first = next(chunks, b'')
         except Exception as e:
-            print(f"获取联系数据时出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write('{"error": "服务器错误"}'.encode('utf-8'))
+            write_app_log('ERROR', '导出数据时出错', {'url': self.path, 'error': str(e)})
+            self.send_json({'error': '服务器错误'}, 500)
+            return
+        chunked = self.request_version != 'HTTP/1.0' and self.protocol_version == 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-store')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+            self.send_header('Connection', 'close')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        
+        sent = 0
+        try:
+            for chunk in itertools.chain((first,), chunks):
+                if not chunk:
+                    continue
+                self.wfile.write(b'%x\r\n%b\r\n' % (len(chunk), chunk) if chunked else chunk)
+                sent += len(chunk)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except Exception as e:
+            # 响应头已经发出，只能断开连接让客户端知道内容不完整
+            self.close_connection = True
+            if not isinstance(e, ConnectionError):
+                write_app_log('ERROR', '导出数据时出错', {'url': self.path, 'error': str(e)})
+        finally:
+            chunks.close()
+            self._response_length = sent
     
     def serve_stats_api(self):
         try:
-            # 读取报名数据
-            registrations = []
-            if os.path.exists(REGISTRATIONS_FILE):
-                with open(REGISTRATIONS_FILE, 'r', encoding='utf-8') as f:
-                    registrations = json.load(f)
-            
-            # 读取联系数据
-            contacts = []
-            if os.path.exists(CONTACTS_FILE):
-                with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-                    contacts = json.load(f)
-            
-            # 计算统计数据
-            now = datetime.datetime.now()
-            today = now.date()
-            week_start = today - datetime.timedelta(days=today.weekday())
-            month_start = today.replace(day=1)
-            
-            # 报名统计
-            reg_today = 0
-            reg_week = 0
-            reg_month = 0
-            course_stats = {}
-            country_stats = {}
-            
-            for reg in registrations:
-                submit_time = reg.get('submitTime', '')
-                if submit_time:
-                    try:
-                        submit_date = datetime.datetime.fromisoformat(submit_time.replace('Z', '+00:00')).date()
-                        if submit_date == today:
-                            reg_today += 1
-                        if submit_date >= week_start:
-                            reg_week += 1
-                        if submit_date >= month_start:
-                            reg_month += 1
-                    except:
-                        pass
-                
-                # 统计课程
-                course = reg.get('course', '其他')
-                course_stats[course] = course_stats.get(course, 0) + 1
-                
-                # 统计国家分布
-                country = reg.get('target_country', reg.get('projects', '其他'))
-                if country:
-                    # 处理多个项目的情况
-                    if ',' in str(country):
-                        countries = [c.strip() for c in str(country).split(',')]
-                        for c in countries:
-                            country_stats[c] = country_stats.get(c, 0) + 1
-                    else:
-                        country_stats[country] = country_stats.get(country, 0) + 1
-                else:
-                    country_stats['其他'] = country_stats.get('其他', 0) + 1
-            
-            # 联系统计
-            contact_today = 0
-            contact_week = 0
-            contact_month = 0
-            
-            for contact in contacts:
-                submit_time = contact.get('submitTime', '')
-                if submit_time:
-                    try:
-                        submit_date = datetime.datetime.strptime(submit_time, '%Y-%m-%d %H:%M:%S').date()
-                        if submit_date == today:
-                            contact_today += 1
-                        if submit_date >= week_start:
-                            contact_week += 1
-                        if submit_date >= month_start:
-                            contact_month += 1
-                    except:
-                        pass
+            query_params = self.query
+            today = datetime.datetime.now().date()
             
-            stats = {
-                'total': len(registrations),
-                'today': reg_today,
-                'thisWeek': reg_week,
-                'thisMonth': reg_month,
-                'byCourse': course_stats,
-                'byCountry': country_stats,
-                'contacts': {
-                    'total': len(contacts),
-                    'today': contact_today,
-                    'thisWeek': contact_week,
-                    'thisMonth': contact_month
-                }
-            }
+            # 所有计数都由写入时维护的索引提供，不再逐条读取记录
+            categories = REGISTRATIONS.category_counts()
+            stats = build_stats(
+                stats_total(categories), REGISTRATIONS.count_by_day(), categories,
+                stats_total(CONTACTS.category_counts()), CONTACTS.count_by_day(), today)
             
-            response = json.dumps(stats, ensure_ascii=False)
+            if query_params.get('verify', ['0'])[0] == '1':
+                # 一致性校验：完整重算一遍，不一致时以重算结果为准并重建索引
+                full_stats = compute_stats_full(REGISTRATIONS.all(), CONTACTS.all(), today)
+                consistent = full_stats == stats
+                if not consistent:
+                    write_app_log('WARN', '统计索引与完整重算结果不一致，已重建索引')
+                    REGISTRATIONS.rebuild_indexes()
+                    CONTACTS.rebuild_indexes()
+                    stats = full_stats
+                stats['consistent'] = consistent
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_json(stats)
             
         except Exception as e:
-            print(f"获取统计数据时出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write('{"error": "服务器错误"}'.encode('utf-8'))
+            write_app_log('ERROR', '获取统计数据时出错', {'error': str(e)})
+            self.send_json({'error': '服务器错误'}, 500)
     
     def serve_trends_api(self):
         try:
             # 解析查询参数
-            from urllib.parse import urlparse, parse_qs
-            parsed_url = urlparse(self.path)
-            query_params = parse_qs(parsed_url.query)
-            days = int(query_params.get('days', [7])[0])
+            query_params = self.query
+            days = max(1, min(int(query_params.get('days', [7])[0]), 3660))
+            granularity = query_params.get('granularity', ['day'])[0]
+            group = query_params.get('group', [None])[0]
+            if granularity not in TREND_GRANULARITIES or (group and group not in TREND_GROUP_FIELDS):
+                self.send_json({'error': '参数错误'}, 400)
+                return
             
-            # 读取报名数据
-            registrations = []
-            if os.path.exists(REGISTRATIONS_FILE):
-                with open(REGISTRATIONS_FILE, 'r', encoding='utf-8') as f:
-                    registrations = json.load(f)
+            # 按日期的计数由存储层的日期索引提供，计算量只与天数有关
+            day_counts = REGISTRATIONS.count_by_day()
+            group_counts = REGISTRATIONS.count_by_day(group) if group else None
             
             # 计算趋势数据
             today = datetime.datetime.now().date()
-            trends = []
-            
-            for i in range(days):
-                date = today - datetime.timedelta(days=i)
-                count = 0
-                
-                for reg in registrations:
-                    submit_time = reg.get('submitTime', '')
-                    if submit_time:
-                        try:
-                            submit_date = datetime.datetime.fromisoformat(submit_time.replace('Z', '+00:00')).date()
-                            if submit_date == date:
-                                count += 1
-                        except:
-                            pass
-                
-                trends.append({
-                    'date': date.strftime('%Y-%m-%d'),
-                    'label': date.strftime('%m/%d'),
-                    'count': count
-                })
-            
-            # 反转数组，使最早的日期在前
-            trends.reverse()
+            trends = compute_trends(day_counts, today, days, granularity, group_counts)
             
-            response = json.dumps(trends, ensure_ascii=False)
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(response.encode('utf-8'))
+            self.send_json(trends)
             
         except Exception as e:
-            print(f"获取趋势数据时出错: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write('{"error": "服务器错误"}'.encode('utf-8'))
+            write_app_log('ERROR', '获取趋势数据时出错', {'error': str(e)})
+            self.send_json({'error': '服务器错误'}, 500)
     
     def serve_admin_page(self):
-        admin_html = '''
+        # 原始字符串：页面脚本里的 '\n' 等转义需要原样交给浏览器
+        admin_html = r'''
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -1038,65 +4704,17 @@ class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
             loadData();
         }
         
-        // 导出数据
+        // 导出数据：由服务器按当前搜索条件流式生成 Excel 文件
         function exportData() {
-            if (allData.length === 0) {
-                alert('暂无数据可导出');
-                return;
+            downloadExport('/api/registrations/export', document.getElementById('searchBox').value);
+        }
+        
+        function downloadExport(url, keyword) {
+            const params = new URLSearchParams({ format: 'xlsx' });
+            if (keyword.trim()) {
+                params.set('q', keyword.trim());
             }
-            
-            // 创建CSV内容
-            const headers = ['ID', '提交时间', '姓名', '性别', '民族', '电话', '邮箱', '身份证号', '户籍省份', '户籍城市', '政治面貌', '家庭地址', '报名项目', '就读学校', '毕业时间', '学历', '是否有毕业证', '高考成绩', '英语成绩', '意向国家', '意向专业', '父亲姓名', '父亲电话', '母亲姓名', '母亲电话', '其他联系电话', '过敏史/病史', '特别声明', '申请人签名', '申请日期'];
-            
-            const csvContent = [headers.join(',')];
-            
-            allData.forEach(item => {
-                const row = [
-                    item.id || '',
-                    new Date(item.submitTime).toLocaleString('zh-CN') || '',
-                    item.name || '',
-                    item.gender || '',
-                    item.ethnicity || '',
-                    item.phone || '',
-                    item.email || '',
-                    item.id_number || '',
-                    item.province || '',
-                    item.city || '',
-                    item.political_status || '',
-                    item.home_address || '',
-                    item.projects || '',
-                    item.current_school || '',
-                    item.graduation_time || '',
-                    item.education_level || '',
-                    item.diploma || '',
-                    item.gaokao_score || '',
-                    item.english_score || '',
-                    item.target_country || '',
-                    item.target_major || '',
-                    item.father_name || '',
-                    item.father_phone || '',
-                    item.mother_name || '',
-                    item.mother_phone || '',
-                    item.emergency_contact || '',
-                    item.medical_history || '',
-                    item.special_note || '',
-                    item.applicant_signature || '',
-                    item.application_date || ''
-                ].map(field => `"${field.toString().replace(/"/g, '""')}"`); // 处理CSV中的引号
-                
-                csvContent.push(row.join(','));
-            });
-            
-            // 下载文件
-            const blob = new Blob([csvContent.join('\n')], { type: 'text/csv;charset=utf-8;' });
-            const link = document.createElement('a');
-            const url = URL.createObjectURL(blob);
-            link.setAttribute('href', url);
-            link.setAttribute('download', `报名数据_${new Date().toISOString().split('T')[0]}.csv`);
-            link.style.visibility = 'hidden';
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
+            window.location.href = url + '?' + params.toString();
         }
         
         // 点击模态框外部关闭
@@ -1227,34 +4845,7 @@ class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
         
         // 导出联系数据
         function exportContactData() {
-            if (allContactData.length === 0) {
-                alert('暂无数据可导出');
-                return;
-            }
-            
-            const headers = ['ID', '提交时间', '姓名', '电话', '类型'];
-            const csvContent = [headers.join(',')];
-            
-            allContactData.forEach((item, index) => {
-                const row = [
-                    item.id || index + 1,
-                    new Date(item.submitTime).toLocaleString('zh-CN'),
-                    item.name || '',
-                    item.phone || '',
-                    '预约探校'
-                ];
-                csvContent.push(row.join(','));
-            });
-            
-            const blob = new Blob([csvContent.join('\n')], { type: 'text/csv;charset=utf-8;' });
-            const link = document.createElement('a');
-            const url = URL.createObjectURL(blob);
-            link.setAttribute('href', url);
-            link.setAttribute('download', `联系数据_${new Date().toISOString().split('T')[0]}.csv`);
-            link.style.visibility = 'hidden';
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
+            downloadExport('/api/contacts/export', document.getElementById('contactSearchBox').value);
         }
         
         // 联系信息搜索功能
@@ -1284,31 +4875,468 @@ class RegistrationHandler(http.server.SimpleHTTPRequestHandler):
 </html>
         '''
         
+        body = admin_html.encode('utf-8')
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(admin_html.encode('utf-8'))
+        self.wfile.write(body)
+
+def wait_readable(sock, timeout):
+    # poll 没有 select 的文件描述符数量上限
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        return bool(poller.poll(timeout * 1000))
+    return bool(select.select([sock], [], [], timeout)[0])
+
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """使用有界线程池处理请求的 TCPServer。
+
+    同时处理的请求数不超过 workers，排队等待的连接不超过 backlog；
+    两者都占满时暂停 accept，新连接留在内核的监听队列中。
+    长连接在两个请求之间的空闲期由一个监视线程用选择器统一等待，不占用工作线程，
+    收到下一个请求时重新提交给线程池，空闲超过 KEEPALIVE_TIMEOUT 秒则关闭。
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+    parks_idle_connections = HTTP_KEEPALIVE
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS,
+                 backlog=SERVER_BACKLOG, bind_and_activate=True):
+        self.request_queue_size = backlog
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._parking = deque()
+        self._idle_lock = threading.Lock()
+        self._idle_pid = None
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except Exception:
+            self._slots.release()
+            self.shutdown_request(request)
+            raise
+
+    def _process_request_worker(self, request, client_address):
+        # 新连接占用一个名额，直到第一次关闭或停放；停放后恢复的连接不再占用名额
+        try:
+            try:
+                handler = self.RequestHandlerClass(request, client_address, self)
+            except Exception:
+                self.handle_error(request, client_address)
+                self.shutdown_request(request)
+            else:
+                self._after_handle(handler)
+        finally:
+            self._slots.release()
+
+    def _resume(self, handler):
+        handler._park_requested = False
+        try:
+            try:
+                handler.serve_connection()
+            finally:
+                handler.finish()
+        except Exception:
+            handler._park_requested = False
+            self.handle_error(handler.request, handler.client_address)
+        self._after_handle(handler)
+
+    def _after_handle(self, handler):
+        if handler._park_requested:
+            self._park(handler)
+        else:
+            self.shutdown_request(handler.request)
+
+    def _park(self, handler):
+        with self._idle_lock:
+            if self._idle_pid != os.getpid():
+                # fork 之后选择器和线程都不能沿用，每个进程各自创建
+                self._idle_pid = os.getpid()
+                self._idle = selectors.DefaultSelector()
+                self._idle_wakeup = socket.socketpair()
+                self._idle.register(self._idle_wakeup[0], selectors.EVENT_READ)
+                threading.Thread(target=self._idle_loop, name='http-idle', daemon=True).start()
+            self._parking.append(handler)
+        self._idle_wakeup[1].send(b'\0')
+
+    def _idle_loop(self):
+        # 停放的连接按停放顺序排列，最早停放的最先超时
+        idle = OrderedDict()
+        while True:
+            timeout = None
+            if idle:
+                timeout = max(0, next(iter(idle.values())) - time.monotonic())
+            for key, _ in self._idle.select(timeout):
+                if key.data is None:
+                    self._idle_wakeup[0].recv(4096)
+                    continue
+                handler = key.data
+                self._idle.unregister(key.fileobj)
+                del idle[handler]
+                try:
+                    self._executor.submit(self._resume, handler)
+                except RuntimeError:
+                    # 服务器正在关闭
+                    self._close_parked(handler)
+            with self._idle_lock:
+                while self._parking:
+                    handler = self._parking.popleft()
+                    try:
+                        self._idle.register(handler.connection, selectors.EVENT_READ, handler)
+                    except (OSError, ValueError):
+                        self._close_parked(handler)
+                        continue
+                    idle[handler] = time.monotonic() + KEEPALIVE_TIMEOUT
+            now = time.monotonic()
+            while idle and next(iter(idle.values())) <= now:
+                handler, _ = idle.popitem(last=False)
+                self._idle.unregister(handler.connection)
+                self._close_parked(handler)
+
+    def _close_parked(self, handler):
+        handler._park_requested = False
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+class AsyncResponseWriter:
+    """asyncio 引擎里充当处理器的 wfile。
+
+    工作线程写出的数据和 sendfile 的文件片段按顺序交给事件循环发送，
+    未发送的数据超过 ASYNC_MAX_PENDING 字节时写入方才会等待，慢速客户端不会长期占住工作线程。
+    """
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._queue = asyncio.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self.error = None
+
+    # 以下方法在工作线程中调用
+    def write(self, data):
+        data = bytes(data)
+        with self._cond:
+            while self._pending > ASYNC_MAX_PENDING and not self.error:
+                self._cond.wait()
+            if self.error:
+                raise ConnectionResetError(str(self.error))
+            self._pending += len(data)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (data, None))
+        return len(data)
+
+    def sendfile(self, file, offset=0, count=None):
+        # 复制一份文件描述符交给事件循环，处理器关闭原文件不影响发送
+        if self.error:
+            raise ConnectionResetError(str(self.error))
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+        dup = os.fdopen(os.dup(file.fileno()), 'rb')
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (None, (dup, offset, count)))
+        return count
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    # 以下协程在事件循环中运行
+    async def run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            data, file_part = item
+            try:
+                if self.error:
+                    continue
+                if data is not None:
+                    self._writer.write(data)
+                    await self._writer.drain()
+                else:
+                    file, offset, count = file_part
+                    await self._loop.sendfile(self._writer.transport, file, offset, count)
+            except (ConnectionError, RuntimeError) as e:
+                self.error = e
+            finally:
+                if file_part:
+                    file_part[0].close()
+                with self._cond:
+                    if data is not None:
+                        self._pending -= len(data)
+                    self._cond.notify_all()
+
+class AsyncBridgeHandler(RegistrationHandler):
+    """asyncio 引擎使用的请求处理器：请求已由事件循环完整读入内存，每次只处理一个请求。"""
+
+    def setup(self):
+        self.rfile, self.wfile, self._requests_handled = self.request
+        self.connection = self.wfile
+
+    def handle(self):
+        self._body_read = False
+        self.close_connection = True
+        self.raw_requestline = b''
+        self.handle_one_request()
+
+    def finish(self):
+        pass
+
+    def handle_expect_100(self):
+        # 事件循环读取请求体之前已经回复过 100 Continue
+        return True
+
+class AsyncHTTPServer:
+    """基于 asyncio 的 HTTP 服务器。
+
+    事件循环负责接受连接、读取请求和发送响应，空闲的长连接只占一个协程；
+    路由和业务逻辑沿用 RegistrationHandler，在线程池中执行，文件读写不会阻塞事件循环。
+    """
+
+    def __init__(self, server_address, workers=SERVER_WORKERS, backlog=SERVER_BACKLOG):
+        self.server_address = server_address
+        self.socket = socket.create_server(server_address, backlog=backlog)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-worker')
+        self.connections = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, sock=self.socket, limit=ASYNC_MAX_HEADER)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername') or ('', 0)
+        # socket.create_server 创建的套接字 proto 为 0，asyncio 不会自动为它接受的连接关闭 Nagle
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        requests = 0
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                requests += 1
+
+                length, expect_continue, chunked = self.parse_head(head)
+                # 过大或分块传输的请求体不读取，由 RegistrationHandler.parse_request 回复 413 / 411 后关闭连接
+                oversized = length > REQUEST_MAX_BYTES
+                body = b''
+                if length and not oversized and not chunked:
+                    if expect_continue:
+                        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                    try:
+                        body = await asyncio.wait_for(reader.readexactly(length), REQUEST_BODY_TIMEOUT)
+                    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                        break
+
+                out = AsyncResponseWriter(loop, writer)
+                sender = asyncio.ensure_future(out.run())
+                try:
+                    close = await loop.run_in_executor(
+                        self._executor, self.run_handler, head + body, out, peer, requests)
+                finally:
+                    out.finish()
+                    await sender
+                if close or out.error or chunked or oversized:
+                    break
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    @staticmethod
+    def parse_head(head):
+        length, expect_continue, chunked = 0, False, False
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                try:
+                    length = max(0, int(value))
+                except ValueError:
+                    length = 0
+            elif name == b'expect':
+                expect_continue = value.strip().lower() == b'100-continue'
+            elif name == b'transfer-encoding':
+                chunked = True
+        return length, expect_continue, chunked
+
+    def run_handler(self, data, out, peer, requests):
+        # 在工作线程中执行；返回 True 表示处理完后关闭连接
+        try:
+            handler = AsyncBridgeHandler((io.BytesIO(data), out, requests - 1), peer, self)
+        except ConnectionError:
+            return True
+        return handler.close_connection
+
+    def server_close(self):
+        self.socket.close()
+        self._executor.shutdown(wait=False)
+
+def create_server():
+    if SERVER_MODE == 'single':
+        # 单线程模式下一个长连接会占住整个服务器，只用短连接
+        RegistrationHandler.protocol_version = 'HTTP/1.0'
+        RegistrationHandler.timeout = None
+        socketserver.TCPServer.allow_reuse_address = True
+        return socketserver.TCPServer(("", PORT), RegistrationHandler)
+    if SERVER_MODE == 'asyncio':
+        return AsyncHTTPServer(("", PORT))
+    return ThreadPoolHTTPServer(("", PORT), RegistrationHandler)
+
+def serve_prefork(httpd, processes):
+    # 父进程负责监听，子进程共享同一个监听套接字并各自运行线程池
+    children = []
+    for index in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            # 每个子进程使用不同的工作进程号，生成的记录 ID 不会与其他子进程重复
+            ID_GENERATOR.set_worker(ID_WORKER_ID + index)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # 收到 SIGTERM 时正常退出，先写出日志队列中剩余的内容
+            signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+            try:
+                httpd.serve_forever()
+            finally:
+                LOGGER.close()
+                os._exit(0)
+        children.append(pid)
+    
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        raise
+
+def migrate_sqlite_command():
+    # 手动执行一次性迁移：python server.py migrate-sqlite
+    for path in (REGISTRATIONS_FILE, CONTACTS_FILE):
+        store = SqliteRecordStore(path)
+        print(f"{store.table}: SQLite 中共有 {store.count()} 条记录")
+
+def build_assets_command():
+    # 手动构建静态资源：python server.py build-assets
+    manifest = build_static_assets()
+    hashed = sum(1 for e in manifest.values() if e.get('url'))
+    compressed = sum(1 for e in manifest.values() if e['encodings'])
+    print(f"静态资源构建完成: {len(manifest)} 个文件，{hashed} 个带哈希地址，{compressed} 个已预压缩")
+
+def build_images_command():
+    # 手动生成图片副本：python server.py build-images
+    if Image is None:
+        print("未安装 Pillow，无法生成图片副本（pip install Pillow）")
+        return
+    count = build_image_derivatives()
+    webp = "，含 WebP 版本" if IMAGE_WEBP else ""
+    print(f"图片副本生成完成: {count} 张图片，宽度档位 {', '.join(map(str, IMAGE_WIDTHS))}{webp}")
 
 def main():
+    if sys.argv[1:] == ['migrate-sqlite']:
+        migrate_sqlite_command()
+        return
+    if sys.argv[1:] == ['build-assets']:
+        build_assets_command()
+        return
+    if sys.argv[1:] == ['build-images']:
+        build_images_command()
+        return
+    
+    if STATIC_BUILD:
+        try:
+            set_static_manifest(build_static_assets())
+        except Exception as e:
+            print(f"构建静态资源时出错，将直接提供源文件: {e}")
+    else:
+        load_static_manifest()
+    if IMAGE_PREBUILD and Image is not None:
+        # 图片副本在后台生成，未生成完的副本会在首次请求时补上
+        threading.Thread(target=build_image_derivatives, daemon=True).start()
+    
+    mode = SERVER_MODE
+    if mode == 'prefork' and not hasattr(os, 'fork'):
+        print("⚠️ 当前系统不支持 fork，改用 threaded 模式")
+        mode = 'threaded'
+    if mode == 'prefork' and ID_WORKER_ID + SERVER_PROCESSES > 1 << IdGenerator.WORKER_BITS:
+        # 子进程依次使用 ID_WORKER_ID + 序号作为工作进程号，超出时不同进程会生成相同的记录 ID
+        sys.exit(f"❌ ID_WORKER_ID（{ID_WORKER_ID}）+ SERVER_PROCESSES（{SERVER_PROCESSES}）超过记录 ID 可用的 "
+                 f"{1 << IdGenerator.WORKER_BITS} 个工作进程号，请减少进程数")
+    
     try:
-        with socketserver.TCPServer(("", PORT), RegistrationHandler) as httpd:
+        with create_server() as httpd:
             print(f"\n🚀 服务器已启动！")
             print(f"📱 网站地址: http://localhost:{PORT}")
             print(f"📊 管理后台: http://localhost:{PORT}/admin")
+            if mode == 'single':
+                print(f"⚙️ 并发模式: single（单线程）")
+            elif mode == 'prefork':
+                print(f"⚙️ 并发模式: prefork（{SERVER_PROCESSES} 个进程 × {SERVER_WORKERS} 个工作线程）")
+            elif mode == 'asyncio':
+                print(f"⚙️ 并发模式: asyncio（事件循环处理连接，{SERVER_WORKERS} 个工作线程执行请求）")
+            else:
+                print(f"⚙️ 并发模式: threaded（{SERVER_WORKERS} 个工作线程，队列上限 {SERVER_BACKLOG}）")
+            if RegistrationHandler.protocol_version == 'HTTP/1.1':
+                print(f"🔗 HTTP/1.1 长连接: 空闲 {KEEPALIVE_TIMEOUT:g} 秒或处理 {KEEPALIVE_MAX_REQUESTS} 个请求后关闭")
             print(f"\n📋 使用说明:")
             print(f"   1. 访问 http://localhost:{PORT} 查看网站")
             print(f"   2. 点击\"点我报名\"按钮填写报名表单")
             print(f"   3. 访问 http://localhost:{PORT}/admin 查看所有报名信息")
             print(f"   4. 在管理后台可以搜索、查看详情、导出Excel")
-            print(f"\n💾 数据存储位置: ./data/registrations.json")
+            if STORAGE_MODE == 'sqlite':
+                print(f"\n💾 数据存储位置: {SQLITE_FILE}（SQLite WAL 模式）")
+            else:
+                print(f"\n💾 数据存储位置: ./data/registrations.json")
+            if STORAGE_MODE == 'journal':
+                print(f"📝 存储模式: journal（新提交先写入 ./data/*.journal.jsonl，每 {JOURNAL_COMPACT_INTERVAL:g} 秒合并一次）")
             print(f"📁 上传文件位置: ./uploads/")
             print(f"\n按 Ctrl+C 停止服务器\n")
             
-            httpd.serve_forever()
+            if mode == 'prefork':
+                serve_prefork(httpd, SERVER_PROCESSES)
+            else:
+                httpd.serve_forever()
     except KeyboardInterrupt:
         print("\n👋 服务器已关闭")
     except Exception as e:
         print(f"启动服务器时出错: {e}")
+    finally:
+        # 线程池在解释器退出时会等待空闲的长连接，先写出日志
+        LOGGER.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
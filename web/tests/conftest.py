@@ -0,0 +1,72 @@
+"""server.py 测试的公共夹具。
+
+server.py 在导入时按当前目录创建 data/、logs/ 等目录并读取环境变量，
+因此先切换到临时目录、设置好环境变量再导入；每个测试使用独立的存储和幂等键文件。
+"""
+
+import http.client
+import importlib
+import os
+import sys
+import threading
+
+import pytest
+
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp('site')
+    previous = os.getcwd()
+    os.chdir(root)
+    os.environ.update({
+        'LOG_CONSOLE': '0',
+        'ACCESS_LOG': '0',
+        # 合并由测试显式调用，后台线程不要在测试过程中合并
+        'JOURNAL_COMPACT_INTERVAL': '3600',
+        'JOURNAL_FSYNC': 'never',
+    })
+    sys.path.insert(0, WEB_DIR)
+    module = importlib.import_module('server')
+    yield module
+    module.LOGGER.close()
+    os.chdir(previous)
+
+
+@pytest.fixture
+def stores(server, tmp_path, monkeypatch):
+    """把报名、联系记录和幂等键换成 tmp_path 下的新文件。"""
+    registrations = server.JsonRecordStore(str(tmp_path / 'registrations.json'))
+    contacts = server.JsonRecordStore(str(tmp_path / 'contacts.json'))
+    monkeypatch.setattr(server, 'REGISTRATIONS', registrations)
+    monkeypatch.setattr(server, 'CONTACTS', contacts)
+    monkeypatch.setattr(server, 'IDEMPOTENCY_CACHE',
+                        server.IdempotencyCache(str(tmp_path / 'idempotency.jsonl'), 3600, 1000, 2))
+    return registrations, contacts
+
+
+class Client:
+    def __init__(self, port):
+        self.port = port
+
+    def request(self, method, path, body=None, headers=None):
+        """发送一个请求，返回 (状态码, 响应头, 响应体)。"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def client(server, stores):
+    httpd = server.ThreadPoolHTTPServer(('127.0.0.1', 0), server.RegistrationHandler, workers=4)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield Client(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,279 @@
+"""HTTP 接口，通过线程池服务器和 http.client 发送真实请求。"""
+
+import concurrent.futures
+import datetime
+import gzip
+import http.client
+import importlib.util
+import json
+import os
+import urllib.parse
+
+import pytest
+
+
+def test_stats_verify_matches_maintained_counts(client, stores):
+    now = datetime.datetime.now().isoformat()
+    stores[0].extend([{'id': i, 'submitTime': now, 'name': f'学生{i}', 'phone': f'1380000{i:04d}',
+                       'course': '语言班', 'target_country': '新加坡,韩国'} for i in range(1, 6)])
+    stores[0].delete_ids([1])
+
+    status, _, body = client.request('GET', '/api/stats?verify=1')
+    stats = json.loads(body)
+    assert status == 200 and stats['consistent'] is True
+    assert (stats['total'], stats['today']) == (4, 4)
+    assert stats['byCountry'] == {'新加坡': 4, '韩国': 4}
+
+
+def test_list_returns_everything_without_list_parameters(client, stores):
+    stores[0].extend([{'id': i, 'submitTime': f'2025-01-01T00:00:{i:02d}', 'name': f'学生{i}'} for i in range(1, 31)])
+
+    # 防缓存的时间戳等其他参数不改变返回结构
+    for path in ('/api/registrations', '/api/registrations?_=1700000000000'):
+        status, _, body = client.request('GET', path)
+        records = json.loads(body)
+        assert status == 200 and len(records) == 30
+        assert records[0]['id'] == 30
+
+    status, headers, body = client.request('GET', '/api/registrations?limit=5&sort=submitTime')
+    result = json.loads(body)
+    assert [r['id'] for r in result['data']] == [1, 2, 3, 4, 5]
+    assert result['total'] == 30 and headers['X-Total-Count'] == '30'
+
+
+STATIC_BODY = ''.join(f'.rule-{i} {{ color: #{i:06x}; }}\n' for i in range(200)).encode('utf-8')
+# 收集阶段还没有导入 server（server 夹具负责），这里直接看 brotli 是否可用
+ENCODINGS = ['identity', 'gzip'] + (['br'] if importlib.util.find_spec('brotli') else [])
+
+
+@pytest.fixture(scope='module')
+def static_path(server):
+    # 处理器从当前目录（server 夹具切换到的临时目录）提供静态文件
+    with open('sample.css', 'wb') as f:
+        f.write(STATIC_BODY)
+    yield '/sample.css'
+    os.remove('sample.css')
+
+
+def decode(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        import brotli
+        return brotli.decompress(body)
+    return body
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_static_etag_304_per_encoding(client, static_path, encoding):
+    status, headers, body = client.request('GET', static_path, headers={'Accept-Encoding': encoding})
+    assert status == 200
+    assert decode(body, headers.get('Content-Encoding')) == STATIC_BODY
+    etag = headers['ETag']
+    assert etag.endswith(f'-{encoding}"') == (encoding != 'identity')
+
+    status, _, body = client.request('GET', static_path,
+                                     headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert status == 304 and body == b''
+    # 其他编码的 ETag 不能让这个编码的响应返回 304
+    other = 'identity' if encoding != 'identity' else 'gzip'
+    status, _, _ = client.request('GET', static_path, headers={'Accept-Encoding': other, 'If-None-Match': etag})
+    assert status == 200
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_api_etag_304_per_encoding(client, encoding):
+    status, headers, _ = client.request('GET', '/api/stats', headers={'Accept-Encoding': encoding})
+    assert status == 200
+    etag = headers['ETag']
+    assert etag.endswith(f'-{encoding}"') == (encoding != 'identity')
+
+    status, _, body = client.request('GET', '/api/stats',
+                                     headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert status == 304 and body == b''
+
+    # 数据变化后 ETag 失效
+    client.request('POST', '/api/contact', json.dumps({'name': '张三', 'phone': '13800000001'}),
+                   {'Content-Type': 'application/json'})
+    status, _, _ = client.request('GET', '/api/stats', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert status == 200
+
+
+def test_single_range(client, static_path):
+    status, headers, body = client.request('GET', static_path, headers={'Range': 'bytes=10-19'})
+    assert status == 206
+    assert headers['Content-Range'] == f'bytes 10-19/{len(STATIC_BODY)}'
+    assert body == STATIC_BODY[10:20]
+
+
+def test_suffix_and_multiple_ranges(client, static_path):
+    status, _, body = client.request('GET', static_path, headers={'Range': 'bytes=-5'})
+    assert status == 206 and body == STATIC_BODY[-5:]
+
+    status, headers, body = client.request('GET', static_path, headers={'Range': 'bytes=0-3,100-103'})
+    assert status == 206
+    assert headers['Content-Type'].startswith('multipart/byteranges; boundary=')
+    assert STATIC_BODY[0:4] in body and STATIC_BODY[100:104] in body
+    assert int(headers['Content-Length']) == len(body)
+
+
+def test_unsatisfiable_range_returns_416(client, static_path):
+    status, headers, body = client.request('GET', static_path, headers={'Range': f'bytes={len(STATIC_BODY)}-'})
+    assert status == 416
+    assert headers['Content-Range'] == f'bytes */{len(STATIC_BODY)}'
+    assert body == b''
+
+
+def test_if_range_only_honours_current_validator(client, static_path):
+    _, headers, _ = client.request('GET', static_path)
+    etag = headers['ETag']
+
+    status, _, body = client.request('GET', static_path, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert status == 206 and body == STATIC_BODY[:10]
+    status, _, body = client.request('GET', static_path, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert status == 200 and body == STATIC_BODY
+
+
+def test_oversized_body_rejected_before_reading(client, server, monkeypatch):
+    monkeypatch.setattr(server, 'REQUEST_MAX_BYTES', 100)
+    status, headers, _ = client.request('POST', '/api/import?type=contacts', body=b'x' * 101,
+                                        headers={'Content-Type': 'text/csv'})
+    assert status == 413
+    assert headers['Connection'] == 'close'
+
+
+def test_chunked_body_returns_411(client):
+    # 服务器不读取分块的请求体，只发请求头，避免客户端写请求体时连接已被关闭
+    conn = http.client.HTTPConnection('127.0.0.1', client.port, timeout=10)
+    try:
+        conn.putrequest('POST', '/api/import?type=contacts')
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 411
+        assert response.getheader('Connection') == 'close'
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('method, path, allowed', [
+    ('PUT', '/api/contacts/1', {'GET', 'HEAD', 'DELETE', 'OPTIONS'}),
+    ('PATCH', '/api/stats', {'GET', 'HEAD', 'OPTIONS'}),
+    ('POST', '/api/stats', {'GET', 'HEAD', 'OPTIONS'}),
+    ('DELETE', '/api/import', {'POST', 'OPTIONS'}),
+])
+def test_wrong_method_returns_405_with_allow(client, method, path, allowed):
+    status, headers, _ = client.request(method, path, body=b'{}')
+    assert status == 405
+    assert {m.strip() for m in headers['Allow'].split(',')} == allowed
+
+
+def test_unknown_path_returns_404(client):
+    status, _, _ = client.request('PUT', '/api/nothing', body=b'{}')
+    assert status == 404
+
+
+def test_head_matches_get_without_body(client, static_path):
+    for path in ('/api/stats', '/api/registrations?limit=5', static_path):
+        _, get_headers, get_body = client.request('GET', path)
+        status, headers, body = client.request('HEAD', path)
+        assert status == 200 and body == b''
+        assert headers['Content-Length'] == str(len(get_body))
+        assert headers['ETag'] == get_headers['ETag']
+
+
+def import_rows(client, body, **params):
+    query = urllib.parse.urlencode({'type': 'contacts', **params})
+    status, _, data = client.request('POST', f'/api/import?{query}', body=body,
+                                     headers={'Content-Type': 'text/csv'})
+    return status, json.loads(data)
+
+
+def test_import_reports_invalid_and_duplicate_rows(client, stores):
+    csv_text = '姓名,电话,类型\n张三,13800000001,contact\n李四,123,contact\n张三,13800000001,callback\n'
+    status, result = import_rows(client, csv_text.encode('utf-8'))
+    assert status == 200
+    assert (result['imported'], result['failed'], result['duplicates']) == (1, 1, 1)
+    assert [e['row'] for e in result['errors']] == [3, 4]
+
+    # 与已有记录重复（同一姓名和电话）的行不再导入
+    status, result = import_rows(client, '姓名,电话\n张三,13800000001\n'.encode('utf-8'))
+    assert (status, result['imported'], result['duplicates']) == (200, 0, 1)
+    assert stores[1].count() == 1
+
+
+def test_import_rejects_unknown_type(client):
+    status, result = import_rows(client, b'name,phone\n', type='nothing')
+    assert status == 400
+    assert result['success'] is False and result['committed'] == 0
+
+
+def test_import_storage_error_returns_json_500(client, stores, monkeypatch):
+    def fail(records):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(stores[1], 'extend', fail)
+    status, result = import_rows(client, '姓名,电话\n张三,13800000001\n'.encode('utf-8'))
+    assert status == 500
+    assert result == {'success': False, 'message': '导入时服务器出错', 'committed': 0}
+
+
+def submit_contact(client, name='张三', phone='13800000001', key=None):
+    headers = {'Content-Type': 'application/json'}
+    if key:
+        headers['Idempotency-Key'] = key
+    status, headers, body = client.request('POST', '/api/contact', json.dumps({'name': name, 'phone': phone}),
+                                           headers)
+    return status, headers, json.loads(body)
+
+
+@pytest.mark.parametrize('mode, status, count, merged', [
+    (None, 200, 1, True), ('flag', 200, 2, False), ('reject', 409, 1, False), ('merge', 200, 1, True)])
+def test_duplicate_submission_response(client, server, stores, monkeypatch, mode, status, count, merged):
+    # mode 为 None 时使用默认配置
+    if mode:
+        monkeypatch.setattr(server, 'DEDUPE_MODE', mode)
+    _, _, first = submit_contact(client)
+    assert first['duplicate'] is False
+
+    code, _, again = submit_contact(client, phone='+86 13800000001')
+    assert code == status
+    assert again['duplicate'] is True and again['duplicateOf'] == first['id']
+    assert again.get('merged', False) is merged
+    assert stores[1].count() == count
+
+
+def test_idempotency_key_replays_first_response(client, stores):
+    status, headers, first = submit_contact(client, key='order-1')
+    assert status == 200 and 'Idempotent-Replayed' not in headers
+
+    status, headers, again = submit_contact(client, name='李四', phone='13900000000', key='order-1')
+    assert status == 200 and headers['Idempotent-Replayed'] == 'true'
+    assert again == first
+    assert stores[1].count() == 1
+
+
+def test_concurrent_requests_with_same_key_store_one_record(client, stores):
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: submit_contact(client, name=f'学生{i}', phone=f'1380000{i:04d}',
+                                                         key='shared-key'), range(8)))
+    assert {r[0] for r in results} == {200}
+    assert len({r[2]['id'] for r in results}) == 1
+    assert stores[1].count() == 1
+
+
+def test_idempotency_keys_are_shared_through_the_file(server, tmp_path):
+    # 两个实例相当于 prefork 的两个进程
+    path = str(tmp_path / 'keys.jsonl')
+    first = server.IdempotencyCache(path, 3600, 100, 0.2)
+    second = server.IdempotencyCache(path, 3600, 100, 0.2)
+
+    assert first.claim('k') is None
+    assert second.claim('k') is server.IdempotencyCache.BUSY
+    first.finish('k', (200, {'id': 1}))
+    assert second.claim('k') == (200, {'id': 1})
+
+    # 处理失败时不缓存，可以用同一个键重试
+    assert second.claim('retry') is None
+    second.finish('retry', None)
+    assert first.claim('retry') is None
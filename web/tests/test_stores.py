@@ -0,0 +1,268 @@
+"""存储后端（JSON、日志、SQLite）和记录 ID。"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+
+def make_record(server, name, phone, **fields):
+    record = {'id': server.ID_GENERATOR.next_id(), 'submitTime': datetime.datetime.now().isoformat(),
+              'name': name, 'phone': phone}
+    record.update(fields)
+    return record
+
+
+def test_json_store_does_not_rewrite_unparsable_file(server, tmp_path):
+    path = str(tmp_path / 'registrations.json')
+    store = server.JsonRecordStore(path)
+    store.append(make_record(server, '张三', '13800000001'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[{"id": 1, "name": "被截断')
+
+    with pytest.raises(RuntimeError):
+        store.append(make_record(server, '李四', '13800000002'))
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == '[{"id": 1, "name": "被截断'
+
+
+def test_journal_replay_restores_adds_updates_and_deletes(server, tmp_path):
+    path = str(tmp_path / 'registrations.json')
+    store = server.JournalRecordStore(path)
+    first, second, third = (make_record(server, name, phone) for name, phone in
+                            (('张三', '13800000001'), ('李四', '13800000002'), ('王五', '13800000003')))
+    store.extend([first, second])
+    store.append(third)
+    store.delete_ids([second['id']])
+    store.append_unique(make_record(server, '张三', '13800000001', email='a@example.com'), 300, 'merge')
+
+    assert not os.path.exists(path)
+    with open(server.journal_path_for(path), encoding='utf-8') as f:
+        ops = [json.loads(line)['op'] for line in f]
+    assert ops == ['add', 'add', 'add', 'delete', 'update']
+
+    reopened = server.JournalRecordStore(path)
+    assert reopened.all() == store.all()
+    assert [r['name'] for r in reopened.all()] == ['张三', '王五']
+    assert reopened.get(first['id'])['email'] == 'a@example.com'
+
+
+def test_journal_compaction_writes_snapshot_and_truncates_journal(server, tmp_path):
+    path = str(tmp_path / 'registrations.json')
+    store = server.JournalRecordStore(path)
+    records = [make_record(server, f'学生{i}', f'1380000{i:04d}') for i in range(10)]
+    store.extend(records)
+    store.delete_ids([records[0]['id']])
+
+    store.compact()
+
+    assert os.path.getsize(server.journal_path_for(path)) == 0
+    assert server.read_json_list(path) == records[1:]
+    assert server.JournalRecordStore(path).all() == records[1:]
+
+
+def test_journal_replay_skips_records_already_in_snapshot(server, tmp_path):
+    # 合并时写完快照、还没清空日志就崩溃：重放不能让记录重复
+    path = str(tmp_path / 'registrations.json')
+    store = server.JournalRecordStore(path)
+    records = [make_record(server, f'学生{i}', f'1390000{i:04d}') for i in range(5)]
+    store.extend(records)
+    server.write_json_atomic(path, records)
+
+    assert server.JournalRecordStore(path).all() == records
+
+
+def test_json_to_sqlite_migration_includes_unmerged_journal(server, tmp_path):
+    path = str(tmp_path / 'registrations.json')
+    snapshot = [make_record(server, '张三', '13800000001', course='语言班', target_country='新加坡,韩国'),
+                make_record(server, '李四', '13800000002', projects=['俄罗斯'])]
+    server.write_json_atomic(path, snapshot)
+    journal = server.JournalRecordStore(path)
+    journal.append(make_record(server, '王五', '13800000003', course='语言班'))
+    journal.delete_ids([snapshot[1]['id']])
+    expected = journal.all()
+
+    db_path = str(tmp_path / 'migrated.sqlite3')
+    migrated = server.SqliteRecordStore(path, db_path)
+    assert migrated.all() == expected
+    assert migrated.category_counts() == journal.category_counts()
+    assert migrated.count_by_day() == journal.count_by_day()
+
+    # store_meta.migrated 保证只迁移一次
+    reopened = server.SqliteRecordStore(path, db_path)
+    assert reopened.count() == len(expected)
+
+
+def varied_records(server, n):
+    # 覆盖多个日期、无法解析的提交时间、多选字段的数组和逗号分隔写法以及缺失的字段
+    now = datetime.datetime.now()
+    countries = ['新加坡', '韩国,俄罗斯', ['美国', '英国'], '', None]
+    records = []
+    for i in range(n):
+        fields = {'course': ['语言班', '本科'][i % 2]}
+        if countries[i % 5] is not None:
+            fields['target_country'] = countries[i % 5]
+            fields['projects'] = countries[(i + 2) % 5]
+        submitted = 'unknown' if i % 11 == 0 else (now - datetime.timedelta(days=i % 4, seconds=i)).isoformat()
+        records.append(make_record(server, f'学生{i}', f'1370000{i:04d}', submitTime=submitted, **fields))
+    return records
+
+
+def assert_same_counts(first, second, server):
+    assert first.category_counts() == second.category_counts()
+    for group in (None,) + server.TREND_GROUP_FIELDS:
+        assert first.count_by_day(group) == second.count_by_day(group)
+
+
+def test_sqlite_counts_follow_every_write(server, tmp_path):
+    sqlite_store = server.SqliteRecordStore(str(tmp_path / 'registrations.json'), str(tmp_path / 'counts.sqlite3'))
+    json_store = server.JsonRecordStore(str(tmp_path / 'mirror.json'))
+    records = varied_records(server, 30)
+    for target in (sqlite_store, json_store):
+        target.extend(json.loads(json.dumps(records)))
+        target.delete_ids([r['id'] for r in records[:7]])
+        target.append_unique(make_record(server, '学生10', '13700000010', course='硕士', projects='韩国'), 3600,
+                             'merge')
+    assert_same_counts(sqlite_store, json_store, server)
+
+    sqlite_store.replace_all(records[:3])
+    json_store.replace_all(records[:3])
+    assert_same_counts(sqlite_store, json_store, server)
+
+
+def test_sqlite_rebuild_indexes_recounts_tables(server, tmp_path):
+    db_path = str(tmp_path / 'counts.sqlite3')
+    store = server.SqliteRecordStore(str(tmp_path / 'registrations.json'), db_path)
+    store.extend(varied_records(server, 20))
+    expected = (store.category_counts(), store.count_by_day(), store.count_by_day('projects'))
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('UPDATE registrations_category_counts SET n = n + 5')
+        conn.execute('DELETE FROM registrations_day_counts')
+    store.rebuild_indexes()
+    assert (store.category_counts(), store.count_by_day(), store.count_by_day('projects')) == expected
+
+
+@pytest.fixture(params=['json', 'journal', 'sqlite'])
+def store(request, server, tmp_path):
+    path = str(tmp_path / 'registrations.json')
+    if request.param == 'sqlite':
+        return server.SqliteRecordStore(path, str(tmp_path / 'test.sqlite3'))
+    if request.param == 'journal':
+        return server.JournalRecordStore(path)
+    return server.JsonRecordStore(path)
+
+
+def test_existing_dedupe_keys_ignore_submit_time(server, store):
+    old = make_record(server, '张三', '+86 138 0000 0001', email='Z@Example.com', submitTime='2020-01-01T00:00:00')
+    store.append(old)
+    keys = ['张三|phone:13800000001', '张三|email:z@example.com', '李四|phone:13800000001']
+    assert store.existing_dedupe_keys(keys) == set(keys[:2])
+
+    store.delete_ids([old['id']])
+    assert store.existing_dedupe_keys(keys) == set()
+
+
+@pytest.mark.parametrize('mode, count', [(None, 1), ('flag', 2), ('reject', 1), ('merge', 1), ('off', 2)])
+def test_append_unique_modes(server, store, mode, count):
+    # mode 为 None 时使用默认值：合并进首次提交的记录
+    first = make_record(server, '张三', '13800000001')
+    stored, existing = store.append_unique(first, 300, *([mode] if mode else []))
+    assert stored == first and existing is None
+
+    again = make_record(server, ' 张三 ', '+86 138 0000 0001', email='z@example.com')
+    stored, existing = store.append_unique(again, 300, *([mode] if mode else []))
+
+    assert store.count() == count
+    if mode == 'off':
+        assert existing is None
+        return
+    assert existing['id'] == first['id']
+    if mode == 'flag':
+        assert stored['duplicateOf'] == first['id']
+    elif mode in (None, 'merge'):
+        assert stored['id'] == first['id'] and store.get(first['id'])['email'] == 'z@example.com'
+    else:
+        assert stored['id'] == first['id']
+
+
+def test_dedupe_defaults_to_merge(server):
+    assert server.DEDUPE_MODE == 'merge'
+
+
+def test_append_unique_keys_include_name(server, store):
+    store.append_unique(make_record(server, '张三', '13800000001'), 300, 'reject')
+    # 同一家庭共用电话给不同的人报名不算重复
+    _, existing = store.append_unique(make_record(server, '张四', '13800000001'), 300, 'reject')
+    assert existing is None
+    assert store.count() == 2
+
+
+def test_append_unique_respects_window(server, store):
+    old = make_record(server, '张三', '13800000001')
+    old['submitTime'] = (datetime.datetime.now() - datetime.timedelta(hours=1)).isoformat()
+    store.append(old)
+    _, existing = store.append_unique(make_record(server, '张三', '13800000001'), 300, 'reject')
+    assert existing is None
+
+
+def test_deleted_records_are_not_duplicates(server, store):
+    first = make_record(server, '张三', '13800000001')
+    store.append(first)
+    store.delete_ids([first['id']])
+    _, existing = store.append_unique(make_record(server, '张三', '13800000001'), 300, 'reject')
+    assert existing is None
+
+
+def test_append_unique_prefers_latest_record_on_equal_time(server, store):
+    submitted = datetime.datetime.now().isoformat()
+    first = make_record(server, '张三', '13800000001', submitTime=submitted)
+    second = make_record(server, '张三', '13800000001', submitTime=submitted)
+    store.extend([first, second])
+    _, existing = store.append_unique(make_record(server, '张三', '13800000001'), 300, 'reject')
+    assert existing['id'] == second['id']
+
+
+def test_flagged_duplicates_are_left_out_of_stats(server, store):
+    first = make_record(server, '张博通', '17774202340', course='语言班')
+    store.append_unique(first, 300, 'flag')
+    store.append_unique(make_record(server, '张博通', '17774202340', course='语言班'), 300, 'flag')
+    assert store.count() == 2
+
+    categories = store.category_counts()
+    assert server.stats_total(categories) == 1
+    assert categories['byCourse'] == {'语言班': 1}
+    assert sum(store.count_by_day().values()) == 1
+    full = server.compute_stats_full(store.all(), [], datetime.date.today())
+    assert (full['total'], full['today']) == (1, 1)
+
+
+def test_ids_unique_across_threads(server):
+    generator = server.IdGenerator(3)
+    results = [[] for _ in range(8)]
+
+    def generate(out):
+        out.extend(generator.next_id() for _ in range(5000))
+
+    threads = [threading.Thread(target=generate, args=(out,)) for out in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [i for out in results for i in out]
+    assert len(set(ids)) == len(ids)
+    assert all(out == sorted(out) for out in results)
+    assert max(ids) < 2 ** 53
+    assert {(i >> server.IdGenerator.SEQUENCE_BITS) & 31 for i in ids} == {3}
+
+
+def test_worker_ids_do_not_overlap(server):
+    generators = [server.IdGenerator(worker) for worker in range(32)]
+    ids = [generator.next_id() for _ in range(200) for generator in generators]
+    assert len(set(ids)) == len(ids)
+    with pytest.raises(ValueError):
+        server.IdGenerator(0).set_worker(32)